@@ -0,0 +1,188 @@
+"""
+Admission control for Gumloop-backed endpoints.
+
+Each pipeline (receipt, recipe, suggest) gets its own AdmissionController that
+caps how many runs are in flight at once. Requests beyond that wait in a
+bounded queue that is drained round-robin across users, so one user firing a
+burst of requests can't starve everyone else. When the queue is full, or the
+estimated wait would blow the caller's deadline, we shed the request right
+away with an Overloaded error instead of letting it time out upstream.
+"""
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+class Overloaded(Exception):
+    """Raised when a request is shed. Carries the HTTP status and Retry-After hint."""
+
+    def __init__(self, message, status=503, retry_after=5):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ('user_key', 'event', 'admitted')
+
+    def __init__(self, user_key):
+        self.user_key = user_key
+        self.event = threading.Event()
+        self.admitted = False
+
+
+class AdmissionController:
+    def __init__(self, name, max_concurrent=4, max_queue=16, per_user_limit=2, max_wait=30.0):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.per_user_limit = per_user_limit
+        self.max_wait = max_wait
+
+        self._lock = threading.Lock()
+        self._active = 0
+        self._queued = 0
+        self._queues = {}          # user_key -> deque of _Waiter
+        self._rotation = deque()   # user keys with waiters, in round-robin order
+        self._per_user = {}        # user_key -> active + queued count
+        self._avg_service = None   # EWMA of run duration in seconds
+
+        self.admitted_total = 0
+        self.rejected_total = 0
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    @contextmanager
+    def admit(self, user_key, deadline=None):
+        """
+        Hold a slot for the duration of the with-block.
+        deadline is an absolute time.monotonic() value; defaults to now + max_wait.
+        """
+        now = time.monotonic()
+        if deadline is None:
+            deadline = now + self.max_wait
+        else:
+            deadline = min(deadline, now + self.max_wait)
+
+        self._acquire(user_key, deadline)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(user_key, time.monotonic() - started)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'active': self._active,
+                'queued': self._queued,
+                'max_concurrent': self.max_concurrent,
+                'max_queue': self.max_queue,
+                'avg_service_seconds': round(self._avg_service, 3) if self._avg_service else None,
+                'admitted_total': self.admitted_total,
+                'rejected_total': self.rejected_total,
+            }
+
+    # ------------------------------------------------------------------
+    # Internals
+    # ------------------------------------------------------------------
+
+    def _retry_after(self):
+        # Rough time until a slot frees up; always at least one second
+        if self._avg_service is None:
+            return 5
+        return max(1, int(self._avg_service * (self._queued + 1) / self.max_concurrent))
+
+    def _reject(self, message, status):
+        self.rejected_total += 1
+        raise Overloaded(f"{self.name}: {message}", status=status, retry_after=self._retry_after())
+
+    def _acquire(self, user_key, deadline):
+        with self._lock:
+            if self._per_user.get(user_key, 0) >= self.per_user_limit:
+                self._reject("too many requests in flight for this user", 429)
+
+            if self._active < self.max_concurrent and self._queued == 0:
+                self._active += 1
+                self._per_user[user_key] = self._per_user.get(user_key, 0) + 1
+                self.admitted_total += 1
+                return
+
+            if self._queued >= self.max_queue:
+                self._reject("queue is full", 503)
+
+            # Deadline-aware admission: don't queue a request we already know won't make it
+            if self._avg_service is not None:
+                expected_wait = self._avg_service * (self._queued + 1) / self.max_concurrent
+                if time.monotonic() + expected_wait > deadline:
+                    self._reject("expected queue wait exceeds request deadline", 503)
+
+            waiter = _Waiter(user_key)
+            if user_key not in self._queues:
+                self._queues[user_key] = deque()
+                self._rotation.append(user_key)
+            self._queues[user_key].append(waiter)
+            self._queued += 1
+            self._per_user[user_key] = self._per_user.get(user_key, 0) + 1
+
+        waiter.event.wait(max(0.0, deadline - time.monotonic()))
+
+        with self._lock:
+            if waiter.admitted:
+                return
+            # Timed out in the queue; withdraw so a release doesn't hand us a slot
+            self._remove_waiter(waiter)
+            self._per_user[user_key] -= 1
+            if self._per_user[user_key] == 0:
+                del self._per_user[user_key]
+            self._reject("timed out waiting for a free slot", 503)
+
+    def _release(self, user_key, duration):
+        with self._lock:
+            if self._avg_service is None:
+                self._avg_service = duration
+            else:
+                self._avg_service = 0.8 * self._avg_service + 0.2 * duration
+
+            self._per_user[user_key] -= 1
+            if self._per_user[user_key] == 0:
+                del self._per_user[user_key]
+
+            waiter = self._next_waiter()
+            if waiter is None:
+                self._active -= 1
+                return
+            # Hand our slot directly to the next waiter; _active stays the same
+            waiter.admitted = True
+            self.admitted_total += 1
+            waiter.event.set()
+
+    def _next_waiter(self):
+        while self._rotation:
+            user_key = self._rotation.popleft()
+            queue = self._queues.get(user_key)
+            if not queue:
+                self._queues.pop(user_key, None)
+                continue
+            waiter = queue.popleft()
+            self._queued -= 1
+            if queue:
+                self._rotation.append(user_key)
+            else:
+                del self._queues[user_key]
+            return waiter
+        return None
+
+    def _remove_waiter(self, waiter):
+        queue = self._queues.get(waiter.user_key)
+        if queue is None or waiter not in queue:
+            return
+        queue.remove(waiter)
+        self._queued -= 1
+        if not queue:
+            del self._queues[waiter.user_key]
+            self._rotation.remove(waiter.user_key)
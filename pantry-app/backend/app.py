@@ -7,34 +7,124 @@ You'll integrate this with Gumloop for AI-powered features.
 Run with: python app.py
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g
 from flask_cors import CORS
 import os
-import csv
-import io
-import json
 import tempfile
+import threading
+import time
+from datetime import datetime, timezone
 from dotenv import load_dotenv
-from receipt_upload import run_pipeline
-from recipe_provided import run_pipeline as run_recipe_pipeline
+from receipt_upload import run_pipeline, invalidate as invalidate_receipt
+from recipe_provided import run_pipeline as run_recipe_pipeline, invalidate as invalidate_recipe
 from recipe_suggest import run_pipeline as run_suggest_pipeline
+from admission import AdmissionController, Overloaded
+from circuit_breaker import gumloop_breaker
+import pipeline_callbacks
+import run_journal
+import hedging
+import shared_cache
+import receipt_dedup
+import receipt_preflight
+import recipe_schema
+import meal_plan
+import suggestion_precompute
+import user_auth
+from models import Recipe, parse_receipt_csv
+import receipt_upload
+import recipe_provided
+import recipe_suggest
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for React frontend
 load_dotenv()  # Load environment variables from .env if present
 
+# Refuse oversized bodies from Content-Length, before Flask streams them into a temp file.
+# Receipts are the only uploads; the slack covers the multipart boundary and form fields
+app.config['MAX_CONTENT_LENGTH'] = receipt_preflight.MAX_BYTES + 64 * 1024
+# Meal plans may carry a whole recipe library, so /api/plan gets its own limit
+PLAN_MAX_BYTES = int(os.getenv('PLAN_MAX_BYTES', str(64 * 1024 * 1024)))
+
 # Gumloop configuration
 GUMLOOP_USER_ID = os.getenv('GUMLOOP_USER_ID', 'ACFRzCqhciYjfQxd77vMlTxTMD22')
 
-# Category mapping for frontend compatibility
-CATEGORY_MAP = {
-    'Proteins': 'protein',
-    'Dairy': 'dairy',
-    'Grains': 'grain',
-    'Fruits': 'fruit',
-    'Vegetables': 'vegetable',
-    'Other': 'other'
-}
+# ============================================================
+# ADMISSION CONTROL
+# ============================================================
+
+# One limiter per Gumloop pipeline so a burst of suggestions can't starve receipt scans
+receipt_admission = AdmissionController(
+    'receipt',
+    max_concurrent=int(os.getenv('RECEIPT_MAX_CONCURRENT', '4')),
+    max_queue=int(os.getenv('RECEIPT_MAX_QUEUE', '16')),
+    per_user_limit=int(os.getenv('RECEIPT_PER_USER_LIMIT', '2')),
+)
+recipe_admission = AdmissionController(
+    'recipe',
+    max_concurrent=int(os.getenv('RECIPE_MAX_CONCURRENT', '4')),
+    max_queue=int(os.getenv('RECIPE_MAX_QUEUE', '16')),
+    per_user_limit=int(os.getenv('RECIPE_PER_USER_LIMIT', '2')),
+)
+suggest_admission = AdmissionController(
+    'suggest',
+    max_concurrent=int(os.getenv('SUGGEST_MAX_CONCURRENT', '2')),
+    max_queue=int(os.getenv('SUGGEST_MAX_QUEUE', '8')),
+    per_user_limit=int(os.getenv('SUGGEST_PER_USER_LIMIT', '2')),
+)
+
+def _user_id():
+    """Firebase uid from the request's verified ID token, or None for anonymous callers."""
+    if 'user_id' not in g:
+        g.user_id = user_auth.verified_uid(request.headers.get('Authorization'))
+    return g.user_id
+
+# Proxies whose X-Forwarded-For we believe (default: the Vite dev proxy on this machine)
+TRUSTED_PROXIES = {p.strip() for p in os.getenv('TRUSTED_PROXIES', '127.0.0.1,::1').split(',') if p.strip()}
+
+def _client_key():
+    """Identify the caller for per-user fairness (verified user id, else client IP)."""
+    user_id = _user_id()
+    if user_id:
+        return user_id
+    address = request.remote_addr or 'anonymous'
+    if address not in TRUSTED_PROXIES:
+        return address
+    # Each trusted proxy appends the address it received from, so walk back from the right
+    # and stop at the first hop we don't run; anything left of it is whatever the client sent
+    for hop in reversed(request.headers.get('X-Forwarded-For', '').split(',')):
+        hop = hop.strip()
+        if hop and hop not in TRUSTED_PROXIES:
+            return hop
+    return address
+
+def _request_deadline():
+    """Optional X-Request-Timeout header (seconds) bounds how long we may queue."""
+    timeout = request.headers.get('X-Request-Timeout')
+    try:
+        return time.monotonic() + float(timeout) if timeout else None
+    except ValueError:
+        return None
+
+def _precompute_suggestions(pantry_csv):
+    # All background runs share one admission key, so they never take more than one
+    # user's share of the suggestion pipeline away from interactive requests
+    with suggest_admission.admit('precompute'):
+        result = run_suggest_pipeline(pantry_csv, GUMLOOP_USER_ID)
+    # Only keep results that will actually show the user a recipe
+    return result if result and recipe_suggest.has_usable_recipe(result['outputs']) else None
+
+suggestion_precomputer = suggestion_precompute.SuggestionPrecomputer(_precompute_suggestions)
+
+@app.errorhandler(413)
+def _too_large_response(e):
+    limit = request.max_content_length or app.config['MAX_CONTENT_LENGTH']
+    return jsonify({'error': f'Request body is too large (limit {limit // (1024 * 1024)} MB)'}), 413
+
+def _overloaded_response(e):
+    response = jsonify({'error': str(e), 'retry_after': e.retry_after})
+    response.status_code = e.status
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
 
 # ============================================================
 # PANTRY ENDPOINTS
@@ -44,6 +134,9 @@ CATEGORY_MAP = {
 pantry_items = []
 recipes = []
 
+# Perceptual hashes of recently scanned receipts, per user
+receipt_index = receipt_dedup.ReceiptIndex()
+
 @app.route('/api/pantry', methods=['GET'])
 def get_pantry():
     return jsonify({'error': 'Not implemented in this build'}), 501
@@ -60,6 +153,23 @@ def update_pantry_item(item_id):
 def delete_pantry_item(item_id):
     return jsonify({'error': 'Not implemented in this build'}), 501
 
+@app.route('/api/pantry/changed', methods=['POST'])
+def pantry_changed():
+    """
+    Called by the frontend after any pantry edit (receipt import, cook, manual change)
+    with the same pantry_csv body as /api/recipes/suggestions. Schedules a debounced
+    background suggestion run so the Suggestions page can answer immediately.
+    """
+    data = request.get_json()
+    if not data or not data.get('pantry_csv', '').strip():
+        return jsonify({'error': 'No pantry data provided'}), 400
+    fingerprint = suggestion_precomputer.schedule(_client_key(), data['pantry_csv'])
+    return jsonify({
+        'success': True,
+        'fingerprint': fingerprint,
+        'debounce_seconds': suggestion_precomputer.debounce
+    }), 202
+
 @app.route('/api/pantry/receipt', methods=['POST'])
 def upload_receipt():
     """
@@ -81,48 +191,64 @@ def upload_receipt():
             file.save(tmp.name)
             temp_path = tmp.name
         
+        # Cheap local checks so unusable photos never cost an OCR run
+        try:
+            preflight = receipt_preflight.preflight(temp_path)
+        except receipt_preflight.PreflightError as e:
+            os.unlink(temp_path)
+            return jsonify({'error': str(e), 'check': e.check, 'preflight': e.report}), 422
+        
+        # Same receipt photographed again? Serve the earlier result instead of re-running OCR.
+        # Only for verified users: an IP can be shared, and one user must never get another's items
+        user_key = _client_key()
+        user_id = _user_id()
+        force = request.form.get('force') in ('1', 'true')
+        try:
+            receipt_hash = receipt_dedup.fingerprint_file(temp_path) if user_id else None
+        except Exception:
+            receipt_hash = None  # Pillow can't read it; let the pipeline decide
+        if receipt_hash is not None and not force:
+            match = receipt_index.lookup(user_id, receipt_hash)
+            if match:
+                os.unlink(temp_path)
+                distance, items = match
+                return jsonify({
+                    'success': True,
+                    'items': [item.to_dict() for item in items],
+                    'count': len(items),
+                    'duplicate': True,
+                    'hash_distance': distance,
+                    'preflight': preflight
+                })
+        
         # Process through Gumloop pipeline
-        csv_text = run_pipeline(temp_path, GUMLOOP_USER_ID)
+        with receipt_admission.admit(user_key, _request_deadline()):
+            csv_text = run_pipeline(temp_path, GUMLOOP_USER_ID, fresh=force)
+        
+        # Parse CSV response into items
+        items = parse_receipt_csv(csv_text)
+        if not items:
+            # Unparseable output shouldn't be served from cache on the next try
+            invalidate_receipt(temp_path)
         
         # Clean up temp file
         os.unlink(temp_path)
         
-        # Parse CSV response into items
-        items = []
-        if csv_text:
-            # Parse the CSV text
-            reader = csv.DictReader(io.StringIO(csv_text.strip()))
-            for idx, row in enumerate(reader):
-                # Map category to frontend format
-                raw_category = row.get('food_category', 'Other')
-                category = CATEGORY_MAP.get(raw_category, 'other')
-                
-                # Parse quantity
-                qty_str = row.get('quantity', '1')
-                try:
-                    quantity = float(qty_str) if '.' in str(qty_str) else int(qty_str)
-                except (ValueError, TypeError):
-                    quantity = 1
-                
-                # Parse unit (handle 'null' string)
-                unit = row.get('unit', 'count')
-                if unit == 'null' or not unit:
-                    unit = 'count'
-                
-                items.append({
-                    'id': idx + 1,
-                    'name': row.get('food_name', 'Unknown Item'),
-                    'quantity': quantity,
-                    'unit': unit,
-                    'category': category
-                })
+        if receipt_hash is not None and items:
+            receipt_index.add(user_id, receipt_hash, items)
         
         return jsonify({
             'success': True,
-            'items': items,
-            'count': len(items)
+            'items': [item.to_dict() for item in items],
+            'count': len(items),
+            'duplicate': False,
+            'preflight': preflight
         })
         
+    except Overloaded as e:
+        if 'temp_path' in locals() and os.path.exists(temp_path):
+            os.unlink(temp_path)
+        return _overloaded_response(e)
     except FileNotFoundError as e:
         return jsonify({'error': f'File processing error: {str(e)}'}), 500
     except TimeoutError as e:
@@ -173,30 +299,34 @@ def get_recipe_from_url():
     
     try:
         # Process through Gumloop recipe pipeline
-        recipe_json_str = run_recipe_pipeline(recipe_url, GUMLOOP_USER_ID)
+        with recipe_admission.admit(_client_key(), _request_deadline()):
+            recipe_json_str = run_recipe_pipeline(recipe_url, GUMLOOP_USER_ID)
         
         if not recipe_json_str:
             return jsonify({'error': 'No recipe data returned from pipeline'}), 500
         
-        # Parse the JSON response
+        # Parse, repair and validate the JSON response against recipe_format.json
         try:
-            recipe_data = json.loads(recipe_json_str)
-        except json.JSONDecodeError:
-            # If it's already a dict, use it directly
-            if isinstance(recipe_json_str, dict):
-                recipe_data = recipe_json_str
-            else:
-                return jsonify({'error': 'Invalid recipe data format'}), 500
+            recipe_data, repairs = recipe_schema.parse_recipe(recipe_json_str)
+        except recipe_schema.RecipeValidationError as e:
+            # Don't keep serving the same broken output for this URL for a week
+            invalidate_recipe(recipe_url)
+            return jsonify({'error': f'Invalid recipe data format: {str(e)}'}), 500
+        if repairs:
+            print(f"Repaired recipe from {recipe_url}: {repairs}")
         
         # Add source URL to the recipe
-        recipe_data['sourceUrl'] = recipe_url
-        recipe_data['source'] = 'Imported Recipe'
+        recipe = Recipe.from_dict(recipe_data)
+        recipe.source_url = recipe_url
+        recipe.source = 'Imported Recipe'
         
         return jsonify({
             'success': True,
-            'recipe': recipe_data
+            'recipe': recipe.to_dict()
         })
         
+    except Overloaded as e:
+        return _overloaded_response(e)
     except TimeoutError as e:
         return jsonify({'error': f'Processing timeout: {str(e)}'}), 504
     except Exception as e:
@@ -218,11 +348,19 @@ def get_suggestions():
         return jsonify({'error': 'Empty pantry data provided'}), 400
     
     try:
-        # Process through Gumloop suggestion pipeline
-        outputs = run_suggest_pipeline(pantry_csv, GUMLOOP_USER_ID)
-        
-        if not outputs:
-            return jsonify({'error': 'No suggestions returned from pipeline'}), 500
+        # Precomputed in the background after the last pantry change?
+        precomputed = suggestion_precomputer.lookup(pantry_csv)
+        if precomputed:
+            outputs, computed_at = precomputed['outputs'], precomputed['computed_at']
+        else:
+            # Process through Gumloop suggestion pipeline. Sorted rows give the same cache
+            # key as a background run for this pantry, so an in-flight one is joined, not repeated
+            with suggest_admission.admit(_client_key(), _request_deadline()):
+                result = run_suggest_pipeline(suggestion_precompute.canonical_csv(pantry_csv), GUMLOOP_USER_ID)
+            if not result:
+                return jsonify({'error': 'No suggestions returned from pipeline'}), 500
+            # Possibly a cache hit from an earlier run, so keep its original time
+            outputs, computed_at = result['outputs'], result['computed_at']
         
         # Parse the 3 recipe outputs
         recipes = []
@@ -233,25 +371,36 @@ def get_suggestions():
             recipe_link = outputs.get(link_key, '')
             if recipe_str:
                 try:
-                    recipe_data = json.loads(recipe_str)
-                    recipe_data['id'] = i
-                    recipe_data['source'] = 'AI Suggested'
-                    recipe_data['sourceUrl'] = recipe_link
-                    recipes.append(recipe_data)
-                except json.JSONDecodeError:
-                    # If it's already a dict, use it directly
-                    if isinstance(recipe_str, dict):
-                        recipe_str['id'] = i
-                        recipe_str['source'] = 'AI Suggested'
-                        recipe_str['sourceUrl'] = recipe_link
-                        recipes.append(recipe_str)
+                    recipe_data, repairs = recipe_schema.parse_recipe(recipe_str)
+                except recipe_schema.RecipeValidationError as e:
+                    # Skip this suggestion but keep the others
+                    print(f"Dropped suggestion {i}: {e}")
+                    continue
+                if repairs:
+                    print(f"Repaired suggestion {i}: {repairs}")
+                recipe = Recipe.from_dict(recipe_data)
+                recipe.id = i
+                recipe.source = 'AI Suggested'
+                recipe.source_url = recipe_link
+                recipes.append(recipe)
+        
+        if recipes and not precomputed:
+            suggestion_precomputer.store(suggestion_precompute.fingerprint(pantry_csv), outputs, computed_at)
+        elif not recipes and precomputed:
+            # Never serve an empty answer twice; the next request runs the pipeline again
+            suggestion_precomputer.discard(pantry_csv)
         
         return jsonify({
             'success': True,
-            'recipes': recipes,
-            'count': len(recipes)
+            'recipes': [recipe.to_dict() for recipe in recipes],
+            'count': len(recipes),
+            'precomputed': bool(precomputed),
+            'computed_at': datetime.fromtimestamp(computed_at, timezone.utc).isoformat(),
+            'age_seconds': round(time.time() - computed_at, 1)
         })
         
+    except Overloaded as e:
+        return _overloaded_response(e)
     except TimeoutError as e:
         return jsonify({'error': f'Processing timeout: {str(e)}'}), 504
     except Exception as e:
@@ -261,6 +410,52 @@ def get_suggestions():
 def get_shopping_list(recipe_id):
     return jsonify({'error': 'Not implemented in this build'}), 501
 
+# ============================================================
+# MEAL PLAN
+# ============================================================
+
+@app.route('/api/plan', methods=['POST'])
+def plan_meals():
+    """
+    Pick recipes from the user's library for the next few days, using up the
+    soonest-expiring pantry items first and keeping the shopping list short.
+    Expects JSON with pantry (list of items), recipes (list) or a library_id
+    from an earlier response, and optional days (default 7) and servings.
+    """
+    request.max_content_length = PLAN_MAX_BYTES
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get('pantry'), list):
+        return jsonify({'error': 'No pantry data provided'}), 400
+    if not all(isinstance(item, dict) for item in data['pantry']):
+        return jsonify({'error': 'Pantry items must be objects'}), 400
+    recipes = data.get('recipes')
+    if recipes and not (isinstance(recipes, list) and all(isinstance(recipe, dict) for recipe in recipes)):
+        return jsonify({'error': 'Recipes must be a list of objects'}), 400
+
+    try:
+        started = time.perf_counter()
+        if recipes:
+            library_id, index = meal_plan.store_library(recipes)
+        elif data.get('library_id'):
+            library_id, index = data['library_id'], meal_plan.get_library(data['library_id'])
+            if index is None:
+                # Evicted, restarted, or indexed by another worker: the client resends recipes
+                return jsonify({'error': 'Unknown library_id; send recipes again'}), 409
+        else:
+            return jsonify({'error': 'No recipes or library_id provided'}), 400
+        indexed = time.perf_counter()
+
+        days = int(data.get('days', 7))
+        servings = data.get('servings')
+        servings = float(servings) if servings is not None else None
+        result = meal_plan.plan_meals(index, data['pantry'], days=min(days, 31), servings=servings)
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': f'Invalid plan request: {str(e)}'}), 400
+
+    result['summary']['index_ms'] = round((indexed - started) * 1000, 1)
+    result['summary']['plan_ms'] = round((time.perf_counter() - indexed) * 1000, 1)
+    return jsonify(dict(result, success=True, library_id=library_id))
+
 # ============================================================
 # INGREDIENT SUBSTITUTES
 # ============================================================
@@ -277,10 +472,69 @@ def get_substitutes(ingredient):
 def get_stats():
     return jsonify({'error': 'Not implemented in this build'}), 501
 
+# ============================================================
+# GUMLOOP STATUS
+# ============================================================
+
+@app.route('/api/gumloop/status', methods=['GET'])
+def get_gumloop_status():
+    return jsonify({
+        'admission': {
+            'receipt': receipt_admission.stats(),
+            'recipe': recipe_admission.stats(),
+            'suggest': suggest_admission.stats(),
+        },
+        'circuit_breaker': gumloop_breaker.stats(),
+        'callbacks': pipeline_callbacks.stats(),
+        'hedging': hedging.stats(),
+        'cache': shared_cache.cache.stats(),
+        'suggestion_precompute': suggestion_precomputer.stats(),
+    })
+
+@app.route('/api/gumloop/callback', methods=['POST'])
+def gumloop_callback():
+    """
+    Completion webhook called by the last step of a Gumloop pipeline.
+    Expects JSON with the run_id; wakes whichever request is waiting on that run.
+    """
+    if not pipeline_callbacks.check_secret(request.headers.get('X-Callback-Secret')):
+        return jsonify({'error': 'Invalid callback secret'}), 403
+    
+    data = request.get_json(silent=True)
+    if not data or not data.get('run_id'):
+        return jsonify({'error': 'No run_id provided'}), 400
+    
+    status = pipeline_callbacks.notify(str(data['run_id']))
+    return jsonify({'success': True, 'status': status})
+
 # ============================================================
 # MAIN
 # ============================================================
 
+_resume_lock = threading.Lock()
+_resumed = False
+
+def resume_pipeline_runs():
+    """Pick up runs a previous process started but never saw finish (once per process)."""
+    global _resumed
+    with _resume_lock:
+        if _resumed:
+            return
+        _resumed = True
+    resumed = run_journal.resume_outstanding({
+        'receipt': receipt_upload.get_pipeline_data,
+        'recipe': recipe_provided.get_pipeline_data,
+        'suggest': recipe_suggest.get_pipeline_data,
+    })
+    if resumed:
+        print(f"🔁 Resuming {resumed} outstanding pipeline run(s)")
+
+# Resume at startup however the app is served (WSGI server, flask run, python app.py). The one
+# exception is the debug reloader's parent process: it only watches files, while the child it
+# spawns (WERKZEUG_RUN_MAIN) serves requests
+if __name__ != '__main__' or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+    resume_pipeline_runs()
+
 if __name__ == '__main__':
     print("🍳 PantryPal Backend Starting...")
     print("📡 API available at http://localhost:5001/api")
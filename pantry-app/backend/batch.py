@@ -0,0 +1,279 @@
+"""
+PantryPal Batch Backfill
+========================
+Runs a folder of receipt images or a file of recipe URLs through the same
+Gumloop pipelines the API uses, for bulk backfills.
+
+    python batch.py receipts ./receipts --out receipts.jsonl
+    python batch.py recipes urls.txt --out recipes.csv --concurrency 8 --rate 2
+
+Inputs run in a bounded thread pool, and pipeline starts are rate limited.
+Normalized results stream to the output file (JSONL or CSV, by extension)
+as each input finishes. Successful inputs, and inputs that can never succeed
+(a photo that fails pre-flight, a recipe that fails validation), are also
+appended to <out>.checkpoint. Re-running the same command after a crash skips
+everything already done, retries other failures, and appends to the same output.
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from dotenv import load_dotenv
+
+import receipt_preflight
+import recipe_schema
+from models import Recipe, parse_receipt_csv
+from receipt_upload import run_pipeline as run_receipt_pipeline
+from recipe_provided import run_pipeline as run_recipe_pipeline
+
+load_dotenv()
+
+GUMLOOP_USER_ID = os.getenv('GUMLOOP_USER_ID', 'ACFRzCqhciYjfQxd77vMlTxTMD22')
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.bmp', '.tif', '.tiff', '.gif'}
+
+RECEIPT_CSV_FIELDS = ['input', 'ok', 'error', 'name', 'quantity', 'unit', 'category']
+# Failures that would happen again on every retry
+PERMANENT_ERRORS = (receipt_preflight.PreflightError, recipe_schema.RecipeValidationError)
+
+RECIPE_CSV_FIELDS = ['input', 'ok', 'error', 'recipe_title', 'servings', 'prep_time_minutes',
+                     'cook_time_minutes', 'ingredients', 'instructions']
+
+
+class RateLimiter:
+    """Token bucket: at most `rate` acquisitions per second, with bursts up to max(1, rate)."""
+
+    def __init__(self, rate):
+        self.rate = rate
+        # At least one token, or a rate below 1/s could never fill the bucket far enough to acquire
+        self.capacity = max(1.0, rate)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+# ============================================================
+# INPUTS AND PROCESSING
+# ============================================================
+
+def list_receipts(directory):
+    paths = []
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS:
+                paths.append(os.path.join(root, name))
+    return sorted(paths)
+
+
+def list_urls(path):
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith('#')]
+
+
+def process_receipt(path, user_id):
+    # Skip unusable images locally instead of paying for an OCR run
+    receipt_preflight.preflight(path)
+    csv_text = run_receipt_pipeline(path, user_id)
+    return {'items': [item.to_dict() for item in parse_receipt_csv(csv_text)]}
+
+
+def process_recipe(url, user_id):
+    raw = run_recipe_pipeline(url, user_id)
+    if not raw:
+        raise ValueError('No recipe data returned from pipeline')
+    recipe_data, _ = recipe_schema.parse_recipe(raw)
+    recipe = Recipe.from_dict(recipe_data)
+    recipe.source_url = url
+    recipe.source = 'Imported Recipe'
+    return {'recipe': recipe.to_dict()}
+
+
+# ============================================================
+# OUTPUT
+# ============================================================
+
+class ResultWriter:
+    """Appends results as they finish and records successful inputs in the checkpoint."""
+
+    def __init__(self, out_path, kind):
+        self.kind = kind
+        self.is_csv = out_path.lower().endswith('.csv')
+        self.checkpoint_path = out_path + '.checkpoint'
+        self._lock = threading.Lock()
+
+        new_file = not os.path.exists(out_path) or os.path.getsize(out_path) == 0
+        self._out = open(out_path, 'a', newline='', encoding='utf-8')
+        self._checkpoint = open(self.checkpoint_path, 'a', encoding='utf-8')
+        if self.is_csv:
+            fields = RECEIPT_CSV_FIELDS if kind == 'receipts' else RECIPE_CSV_FIELDS
+            self._csv = csv.DictWriter(self._out, fieldnames=fields)
+            if new_file:
+                self._csv.writeheader()
+
+    def done_inputs(self):
+        with open(self.checkpoint_path, encoding='utf-8') as f:
+            return {line.rstrip('\n') for line in f if line.strip()}
+
+    def write(self, item, result, error, permanent=False):
+        with self._lock:
+            if self.is_csv:
+                for row in self._csv_rows(item, result, error):
+                    self._csv.writerow(row)
+            else:
+                record = {'input': item, 'ok': error is None}
+                if error is None:
+                    record.update(result)
+                else:
+                    record['error'] = error
+                    record['permanent'] = permanent
+                self._out.write(json.dumps(record) + '\n')
+            self._out.flush()
+            # Checkpoint once the result is safely on disk; transient failures are retried next run
+            if error is None or permanent:
+                self._checkpoint.write(item + '\n')
+                self._checkpoint.flush()
+
+    def _csv_rows(self, item, result, error):
+        if error is not None:
+            return [{'input': item, 'ok': False, 'error': error}]
+        if self.kind == 'receipts':
+            rows = [dict({k: v for k, v in i.items() if k != 'id'}, input=item, ok=True) for i in result['items']]
+            return rows or [{'input': item, 'ok': True}]
+        recipe = result['recipe']
+        return [{
+            'input': item,
+            'ok': True,
+            'recipe_title': recipe.get('recipe_title'),
+            'servings': recipe.get('servings'),
+            'prep_time_minutes': recipe.get('prep_time_minutes'),
+            'cook_time_minutes': recipe.get('cook_time_minutes'),
+            'ingredients': len(recipe.get('ingredients', [])),
+            'instructions': len(recipe.get('instructions', [])),
+        }]
+
+    def close(self):
+        self._out.close()
+        self._checkpoint.close()
+
+
+def _format_duration(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+# ============================================================
+# MAIN
+# ============================================================
+
+def run_batch(kind, items, out_path, concurrency, rate, user_id):
+    writer = ResultWriter(out_path, kind)
+    done = writer.done_inputs()
+    pending = [item for item in items if item not in done]
+    if done:
+        print(f"Resuming: {len(items) - len(pending)} of {len(items)} already done")
+    if not pending:
+        writer.close()
+        return 0
+
+    process = process_receipt if kind == 'receipts' else process_recipe
+    limiter = RateLimiter(rate)
+
+    def run_one(item):
+        limiter.acquire()
+        started = time.monotonic()
+        try:
+            return item, process(item, user_id), None, False, time.monotonic() - started
+        except Exception as e:
+            return item, None, str(e), isinstance(e, PERMANENT_ERRORS), time.monotonic() - started
+
+    start = time.monotonic()
+    completed = failed = rejected = 0
+    handled = set()
+
+    def record(future):
+        nonlocal completed, failed, rejected
+        handled.add(future)
+        item, result, error, permanent, seconds = future.result()
+        writer.write(item, result, error, permanent)
+        completed += 1
+        failed += error is not None
+        rejected += permanent
+
+        elapsed = time.monotonic() - start
+        per_minute = completed / elapsed * 60 if elapsed else 0
+        eta = (len(pending) - completed) / (completed / elapsed) if completed else 0
+        status = ('REJECTED' if permanent else 'FAILED') if error else 'ok'
+        print(f"[{completed}/{len(pending)}] {status:8s} {seconds:5.1f}s {item}"
+              f"  |  {per_minute:.1f}/min, ETA {_format_duration(eta)}")
+        if error:
+            print(f"    {error}")
+
+    pool = ThreadPoolExecutor(max_workers=concurrency)
+    futures = []
+    try:
+        futures = [pool.submit(run_one, item) for item in pending]
+        for future in as_completed(futures):
+            record(future)
+    except KeyboardInterrupt:
+        # Drop everything still queued; runs already started are paid for, so keep their results
+        pool.shutdown(wait=False, cancel_futures=True)
+        running = [f for f in futures if f not in handled and not f.cancelled()]
+        print(f"\nInterrupted: cancelled queued inputs, waiting for {len(running)} in flight (Ctrl-C again to abort)")
+        for future in as_completed(running):
+            record(future)
+        print(f"Stopped: {completed - failed} succeeded, {failed} failed; re-run the same command to resume")
+        return 130
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+        writer.close()
+
+    elapsed = time.monotonic() - start
+    print(f"\nDone: {completed - failed} succeeded, {failed} failed ({rejected} rejected for good) "
+          f"in {_format_duration(elapsed)}")
+    return 1 if failed else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backfill receipts or recipe URLs through the Gumloop pipelines.")
+    parser.add_argument('kind', choices=['receipts', 'recipes'])
+    parser.add_argument('source', help="Directory of receipt images, or a text file with one recipe URL per line")
+    parser.add_argument('--out', required=True, help="Output file (.jsonl or .csv); a .checkpoint file is kept next to it")
+    parser.add_argument('--concurrency', type=int, default=4, help="Pipeline runs in flight at once (default 4)")
+    parser.add_argument('--rate', type=float, default=1.0, help="Max pipeline starts per second, 0 for unlimited (default 1)")
+    parser.add_argument('--user-id', default=GUMLOOP_USER_ID)
+    args = parser.parse_args(argv)
+
+    if args.kind == 'receipts':
+        if not os.path.isdir(args.source):
+            parser.error(f"Not a directory: {args.source}")
+        items = list_receipts(args.source)
+    else:
+        if not os.path.isfile(args.source):
+            parser.error(f"File not found: {args.source}")
+        items = list_urls(args.source)
+
+    print(f"📦 {len(items)} {args.kind} to process -> {args.out}")
+    return run_batch(args.kind, items, args.out, args.concurrency, args.rate, args.user_id)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,189 @@
+"""
+Circuit breaker shared by all Gumloop pipeline modules.
+
+Every HTTP call to the Gumloop API goes through gumloop_breaker.request(). The
+breaker keeps a sliding window of recent outcomes; once the error/timeout rate
+crosses the threshold it opens and calls fail immediately with CircuitOpenError
+(a 503 with Retry-After) instead of each request waiting out the 30 s request
+timeout or the 300 s polling loop. After a cooldown it goes half-open and lets a
+few probe calls through; if they succeed the circuit closes again.
+
+Run status polls are tracked in their own window. A few long runs make dozens of
+healthy polls a minute, and counting those alongside starts/uploads would hide a
+start failure rate of 100%. Each window opens the circuit on its own; the
+'calls' window holds start/upload requests plus one outcome per finished run
+(record_success / record_failure).
+"""
+
+import os
+import threading
+import time
+from collections import deque
+
+import requests
+
+from admission import Overloaded
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Overloaded):
+    def __init__(self, message, retry_after):
+        super().__init__(message, status=503, retry_after=retry_after)
+
+
+class CircuitBreaker:
+    def __init__(self, name, window_seconds=60.0, min_calls=5, failure_threshold=0.5,
+                 cooldown=30.0, half_open_probes=2):
+        self.name = name
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.half_open_probes = half_open_probes
+
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        # channel ('calls' / 'polls') -> deque of (timestamp, outcome), outcome in 'ok' / 'error' / 'timeout'
+        self._outcomes = {'calls': deque(), 'polls': deque()}
+
+        self.short_circuited_total = 0
+        self.opened_total = 0
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    def request(self, method, url, poll=False, **kwargs):
+        """
+        Perform a requests call guarded by the breaker.
+        Raises CircuitOpenError when open; otherwise returns the response or
+        re-raises the underlying requests exception so callers' error handling
+        stays the same. Pass poll=True for run status checks.
+        """
+        channel = 'polls' if poll else 'calls'
+        probe = self.before_call()
+        try:
+            response = requests.request(method, url, **kwargs)
+        except requests.exceptions.Timeout:
+            self._record('timeout', probe, channel)
+            raise
+        except requests.exceptions.RequestException:
+            self._record('error', probe, channel)
+            raise
+        # 4xx means our request was bad, not that Gumloop is unhealthy
+        self._record('error' if response.status_code >= 500 else 'ok', probe, channel)
+        return response
+
+    def before_call(self):
+        """Check whether a call may proceed. Returns True if it is a half-open probe."""
+        with self._lock:
+            if self._state == OPEN:
+                elapsed = time.monotonic() - self._opened_at
+                if elapsed < self.cooldown:
+                    self.short_circuited_total += 1
+                    raise CircuitOpenError(
+                        f"Gumloop circuit open after repeated failures; retry in {int(self.cooldown - elapsed) + 1}s",
+                        retry_after=int(self.cooldown - elapsed) + 1,
+                    )
+                self._state = HALF_OPEN
+                self._probes_in_flight = 0
+                self._probe_successes = 0
+
+            if self._state == HALF_OPEN:
+                if self._probes_in_flight >= self.half_open_probes:
+                    self.short_circuited_total += 1
+                    raise CircuitOpenError("Gumloop circuit half-open; probe in progress", retry_after=1)
+                self._probes_in_flight += 1
+                return True
+            return False
+
+    def record_success(self):
+        """Record a run that finished (DONE), so each run weighs the same however long it polled."""
+        self._record('ok', False)
+
+    def record_failure(self, timeout=False):
+        """Record a failure seen outside request(), e.g. a FAILED run or a polling timeout."""
+        self._record('timeout' if timeout else 'error', False)
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.cooldown:
+                return HALF_OPEN
+            return self._state
+
+    def stats(self):
+        state = self.state
+        with self._lock:
+            now = time.monotonic()
+            windows = {}
+            for channel, outcomes in self._outcomes.items():
+                self._trim(outcomes, now)
+                counts = {'ok': 0, 'error': 0, 'timeout': 0}
+                for _, outcome in outcomes:
+                    counts[outcome] += 1
+                total = len(outcomes)
+                windows[channel] = {
+                    'window_calls': total,
+                    'window_errors': counts['error'],
+                    'window_timeouts': counts['timeout'],
+                    'failure_rate': round((counts['error'] + counts['timeout']) / total, 3) if total else 0.0,
+                }
+            return dict(windows['calls'], state=state, polls=windows['polls'],
+                        opened_total=self.opened_total, short_circuited_total=self.short_circuited_total)
+
+    # ------------------------------------------------------------------
+    # Internals
+    # ------------------------------------------------------------------
+
+    def _trim(self, outcomes, now):
+        cutoff = now - self.window_seconds
+        while outcomes and outcomes[0][0] < cutoff:
+            outcomes.popleft()
+
+    def _open(self, now):
+        self._state = OPEN
+        self._opened_at = now
+        self.opened_total += 1
+        print(f"[circuit:{self.name}] opened")
+
+    def _record(self, outcome, probe, channel='calls'):
+        now = time.monotonic()
+        with self._lock:
+            if probe and self._state == HALF_OPEN:
+                self._probes_in_flight -= 1
+                if outcome != 'ok':
+                    self._open(now)
+                    return
+                self._probe_successes += 1
+                if self._probe_successes >= self.half_open_probes:
+                    self._state = CLOSED
+                    for outcomes in self._outcomes.values():
+                        outcomes.clear()
+                    print(f"[circuit:{self.name}] closed")
+                return
+
+            outcomes = self._outcomes[channel]
+            outcomes.append((now, outcome))
+            self._trim(outcomes, now)
+            if self._state != CLOSED or len(outcomes) < self.min_calls:
+                return
+            failures = sum(1 for _, o in outcomes if o != 'ok')
+            if failures / len(outcomes) >= self.failure_threshold:
+                self._open(now)
+
+
+# Shared by receipt_upload, recipe_provided and recipe_suggest
+gumloop_breaker = CircuitBreaker(
+    'gumloop',
+    window_seconds=float(os.getenv('GUMLOOP_BREAKER_WINDOW', '60')),
+    min_calls=int(os.getenv('GUMLOOP_BREAKER_MIN_CALLS', '5')),
+    failure_threshold=float(os.getenv('GUMLOOP_BREAKER_THRESHOLD', '0.5')),
+    cooldown=float(os.getenv('GUMLOOP_BREAKER_COOLDOWN', '30')),
+)
@@ -0,0 +1,151 @@
+"""
+Hedged requests for straggling Gumloop runs.
+
+Most runs finish quickly but a few sit in get_pipeline_data for minutes. With
+GUMLOOP_HEDGING=1, once a run has been waiting longer than the pipeline's
+learned latency percentile (GUMLOOP_HEDGE_PERCENTILE, p95 by default) we start
+one duplicate run with the same inputs and take whichever finishes first. The
+loser is left to finish on Gumloop's side; we just stop polling it.
+
+A token bucket per pipeline caps the extra upstream spend: every waited run
+earns GUMLOOP_HEDGE_BUDGET tokens (0.05 = at most ~5% extra runs) and every
+hedge costs one.
+
+Latency samples are recorded even when hedging is off, so the percentiles are
+already warm when it gets turned on.
+"""
+
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+ENABLED = os.getenv('GUMLOOP_HEDGING', '0') == '1'
+PERCENTILE = float(os.getenv('GUMLOOP_HEDGE_PERCENTILE', '95'))
+BUDGET_RATIO = float(os.getenv('GUMLOOP_HEDGE_BUDGET', '0.05'))
+BUDGET_BURST = 3.0
+MIN_SAMPLES = 20
+MIN_DELAY = float(os.getenv('GUMLOOP_HEDGE_MIN_DELAY', '5'))
+
+_lock = threading.Lock()
+_samples = {}    # pipeline -> deque of recent run durations (seconds)
+_tokens = {}     # pipeline -> hedge budget tokens
+_stats = {}      # pipeline -> counters
+
+
+def _pipeline_stats(pipeline):
+    return _stats.setdefault(pipeline, {'runs': 0, 'hedges_started': 0, 'hedges_won': 0, 'budget_denied': 0})
+
+
+def record_latency(pipeline, seconds):
+    with _lock:
+        _samples.setdefault(pipeline, deque(maxlen=500)).append(seconds)
+
+
+def percentile(pipeline, pct=PERCENTILE):
+    """Latency percentile for a pipeline, or None until we have enough samples."""
+    with _lock:
+        samples = sorted(_samples.get(pipeline, ()))
+    if len(samples) < MIN_SAMPLES:
+        return None
+    index = min(len(samples) - 1, int(round(pct / 100.0 * (len(samples) - 1))))
+    return samples[index]
+
+
+def _earn(pipeline):
+    with _lock:
+        _pipeline_stats(pipeline)['runs'] += 1
+        _tokens[pipeline] = min(BUDGET_BURST, _tokens.get(pipeline, 1.0) + BUDGET_RATIO)
+
+
+def _try_spend(pipeline):
+    with _lock:
+        if _tokens.get(pipeline, 1.0) < 1.0:
+            _pipeline_stats(pipeline)['budget_denied'] += 1
+            return False
+        _tokens[pipeline] = _tokens.get(pipeline, 1.0) - 1.0
+        _pipeline_stats(pipeline)['hedges_started'] += 1
+        return True
+
+
+def stats():
+    with _lock:
+        pipelines = set(_samples) | set(_stats)
+        counters = {p: dict(_pipeline_stats(p), budget_tokens=round(_tokens.get(p, 1.0), 2)) for p in pipelines}
+    for p in counters:
+        p50, p95 = percentile(p, 50), percentile(p, 95)
+        counters[p]['p50_seconds'] = round(p50, 2) if p50 is not None else None
+        counters[p]['p95_seconds'] = round(p95, 2) if p95 is not None else None
+    return {'enabled': ENABLED, 'pipelines': counters}
+
+
+def hedged_wait(pipeline, start, wait):
+    """
+    Wrap a pipeline's wait function with hedging.
+    start() starts a fresh run with the same inputs; wait(response, cancel) polls a
+    run until it's done, returning early (None) once cancel is set.
+    Returns a function taking the primary start_pipeline response.
+    """
+    def run(response):
+        _earn(pipeline)
+        threshold = percentile(pipeline) if ENABLED else None
+        if threshold is None:
+            started = time.monotonic()
+            data = wait(response, None)
+            record_latency(pipeline, time.monotonic() - started)
+            return data
+
+        results = queue.Queue()
+        cancels = {}
+
+        def attempt(label, run_response):
+            cancel = cancels[label] = threading.Event()
+            started = time.monotonic()
+
+            def target():
+                try:
+                    data = wait(run_response, cancel)
+                except Exception as e:
+                    results.put((label, None, e))
+                    return
+                if not cancel.is_set():
+                    record_latency(pipeline, time.monotonic() - started)
+                results.put((label, data, None))
+
+            threading.Thread(target=target, daemon=True).start()
+
+        attempt('primary', response)
+        pending = 1
+        try:
+            first = results.get(timeout=max(threshold, MIN_DELAY))
+        except queue.Empty:
+            first = None
+            if _try_spend(pipeline):
+                print(f"Hedging slow {pipeline} run {response.get('run_id')} after {max(threshold, MIN_DELAY):.1f}s")
+                try:
+                    attempt('hedge', start())
+                    pending += 1
+                except Exception as e:
+                    # Couldn't start the duplicate; just keep waiting on the primary
+                    print(f"Hedge start failed: {e}")
+
+        first_error = None
+        try:
+            while True:
+                label, data, error = first if first is not None else results.get()
+                first = None
+                pending -= 1
+                if error is None:
+                    if label == 'hedge':
+                        with _lock:
+                            _pipeline_stats(pipeline)['hedges_won'] += 1
+                    return data
+                first_error = first_error or error
+                if pending == 0:
+                    raise first_error
+        finally:
+            for cancel in cancels.values():
+                cancel.set()
+
+    return run
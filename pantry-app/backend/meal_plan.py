@@ -0,0 +1,473 @@
+"""
+Meal-plan optimizer: pick K recipes from a recipe library that together use up
+as much of the pantry as possible, soonest-expiring first, while keeping the
+shopping list short.
+
+The library is indexed once into a sparse recipe x ingredient matrix (NumPy
+COO arrays: one entry per recipe ingredient, with its amount in base units).
+Each greedy step scores every recipe at once against the current pantry
+vector with a single bincount:
+
+    score[r] = sum of pantry weights for the ingredients r would use up
+             - MISSING_PENALTY for every ingredient that isn't in the pantry
+               and isn't already on the shopping list
+
+then takes the best recipe, scales its ingredients to the requested servings,
+subtracts them from the pantry, and adds any shortfall to the shopping list.
+Because used-up items stop scoring and bought items stop costing, later picks
+favour recipes that share what earlier picks put on the list.
+
+Pantry weights come from expiry: 1 for long-lived items, up to
+1 + EXPIRY_WEIGHT for items expiring within the plan. Items without an
+expiryDate get an estimate from their category (the receipt pipeline's
+food_category).
+
+Building the index is the slow part for a large library, so store_library()
+keeps the last few indexes in memory under a library_id that later requests
+can send instead of the full recipe list.
+
+Run `python meal_plan.py` for a timing run on 50k synthetic recipes.
+"""
+
+import math
+import os
+import re
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import date, datetime
+from functools import lru_cache
+
+import numpy as np
+
+# Built indexes kept in memory, so repeat plans can send library_id instead of every recipe
+LIBRARY_CACHE_SIZE = int(os.getenv('PLAN_LIBRARY_CACHE_SIZE', '4'))
+MISSING_PENALTY = 0.6
+EXPIRY_WEIGHT = 4.0
+# Matches the "expiring soon" window the Suggestions page uses
+EXPIRING_DAYS = 3
+# Rough shelf life by category, for pantry items without an expiry date
+SHELF_LIFE_DAYS = {
+    'protein': 3,
+    'dairy': 7,
+    'vegetable': 5,
+    'fruit': 5,
+    'grain': 180,
+    'other': 30,
+}
+# Assumed to be on hand; they neither score nor go on the shopping list
+STAPLES = frozenset(['salt', 'pepper', 'black pepper', 'water', 'ice', 'salt and pepper'])
+
+# Unit -> (dimension, factor to base unit). Dimensions: count, grams, millilitres.
+COUNT, MASS, VOLUME, UNKNOWN = 0, 1, 2, -1
+_UNITS = {
+    '': (COUNT, 1), 'count': (COUNT, 1), 'whole': (COUNT, 1), 'piece': (COUNT, 1), 'pieces': (COUNT, 1),
+    'large': (COUNT, 1), 'medium': (COUNT, 1), 'small': (COUNT, 1), 'clove': (COUNT, 1), 'cloves': (COUNT, 1),
+    'g': (MASS, 1), 'gram': (MASS, 1), 'grams': (MASS, 1), 'kg': (MASS, 1000),
+    'oz': (MASS, 28.35), 'ounce': (MASS, 28.35), 'ounces': (MASS, 28.35),
+    'lb': (MASS, 453.6), 'lbs': (MASS, 453.6), 'pound': (MASS, 453.6), 'pounds': (MASS, 453.6),
+    'ml': (VOLUME, 1), 'l': (VOLUME, 1000), 'liter': (VOLUME, 1000), 'litre': (VOLUME, 1000),
+    'cup': (VOLUME, 240), 'cups': (VOLUME, 240), 'gallon': (VOLUME, 3785),
+    'tbsp': (VOLUME, 15), 'tablespoon': (VOLUME, 15), 'tablespoons': (VOLUME, 15),
+    'tsp': (VOLUME, 5), 'teaspoon': (VOLUME, 5), 'teaspoons': (VOLUME, 5),
+}
+_BASE_UNIT = {COUNT: 'count', MASS: 'g', VOLUME: 'ml'}
+
+_WORD = re.compile(r'[a-z]+')
+_QUANTITY = re.compile(r'(\d+(?:\.\d+)?)(?:\s+(\d+)/(\d+)|/(\d+))?')
+_UNICODE_FRACTIONS = {'½': '1/2', '⅓': '1/3', '⅔': '2/3', '¼': '1/4', '¾': '3/4', '⅛': '1/8'}
+
+
+class PlanError(ValueError):
+    pass
+
+
+# ============================================================
+# PARSING
+# ============================================================
+
+@lru_cache(maxsize=65536)
+def normalize_name(name):
+    """Lowercase words with a crude singular form, so 'Tomatoes' and 'tomato' match."""
+    words = []
+    for word in _WORD.findall(name.lower()):
+        if word.endswith('oes') or word.endswith('ies'):
+            word = word[:-2] if word.endswith('oes') else word[:-3] + 'y'
+        elif word.endswith('s') and not word.endswith('ss') and len(word) > 3:
+            word = word[:-1]
+        words.append(word)
+    return ' '.join(words)
+
+
+def parse_quantity(text):
+    """'2', '1.5', '1/2', '1 1/2', '½' -> float, or None for 'to taste' and friends."""
+    if isinstance(text, (int, float)) and not isinstance(text, bool):
+        return float(text)
+    if not text:
+        return None
+    text = str(text)
+    if not text.isascii():
+        for symbol, fraction in _UNICODE_FRACTIONS.items():
+            text = text.replace(symbol, ' ' + fraction)
+    match = _QUANTITY.search(text)
+    if not match:
+        return None
+    whole, numerator, denominator, over = match.groups()
+    if over:
+        return float(whole) / float(over) if float(over) else None
+    value = float(whole)
+    if numerator:
+        value += float(numerator) / float(denominator)
+    return value
+
+
+def to_base(quantity, unit):
+    """Returns (dimension, amount in base units); amount is NaN when it can't be compared."""
+    # Client JSON can hold lists or objects here, which the cache can't hash
+    if not isinstance(quantity, (str, int, float)):
+        quantity = None
+    if not isinstance(unit, str):
+        unit = None
+    return _to_base(quantity, unit)
+
+
+def _servings(value):
+    """Leading number of a servings value ('4', 4, '4-6 people'), or 0 when there isn't one."""
+    if not isinstance(value, (str, int, float)):
+        return 0
+    amount = parse_quantity(value)
+    return amount if amount is not None and 0 < amount < float('inf') else 0
+
+
+@lru_cache(maxsize=65536)
+def _to_base(quantity, unit):
+    amount = parse_quantity(quantity)
+    dimension, factor = _UNITS.get((unit or '').strip().lower().rstrip('.'), (UNKNOWN, 1))
+    if amount is None or dimension == UNKNOWN:
+        return UNKNOWN, np.nan
+    return dimension, amount * factor
+
+
+def _parse_date(value):
+    if not value:
+        return None
+    try:
+        return datetime.strptime(str(value)[:10], '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+
+# ============================================================
+# RECIPE INDEX
+# ============================================================
+
+class RecipeIndex:
+    """Sparse recipe x ingredient matrix over a recipe library."""
+
+    def __init__(self, recipes):
+        # Only what a plan response needs; the client already has the full recipes,
+        # and libraries stay cached long after the request that sent them
+        self.ids = []            # row -> recipe id (None if the client sent none)
+        self.titles = []         # row -> recipe title
+        self.vocab = {}          # normalized ingredient name -> column
+        self.names = []          # column -> display name (first spelling seen)
+        rows, cols, dims, amounts = [], [], [], []
+        row_ptr = [0]
+        servings = []
+
+        for r, recipe in enumerate(recipes):
+            title = recipe.get('recipe_title') or recipe.get('name')
+            recipe_id = recipe.get('id')
+            self.titles.append(title if isinstance(title, str) else None)
+            self.ids.append(recipe_id if isinstance(recipe_id, (str, int)) and not isinstance(recipe_id, bool) else None)
+            seen = {}
+            ingredients = recipe.get('ingredients')
+            for ingredient in ingredients if isinstance(ingredients, list) else ():
+                name = ingredient.get('name') if isinstance(ingredient, dict) else None
+                if not name or not isinstance(name, str):
+                    continue
+                key = normalize_name(name)
+                if not key or key in STAPLES:
+                    continue
+                col = self.vocab.get(key)
+                if col is None:
+                    col = self.vocab[key] = len(self.names)
+                    self.names.append(name.strip())
+                dimension, amount = to_base(ingredient.get('quantity'), ingredient.get('unit'))
+                if col in seen:
+                    # Same ingredient listed twice (e.g. for sauce and garnish): merge amounts
+                    i = seen[col]
+                    if dims[i] == dimension and dimension != UNKNOWN:
+                        amounts[i] += amount
+                    continue
+                seen[col] = len(cols)
+                rows.append(r)
+                cols.append(col)
+                dims.append(dimension)
+                amounts.append(amount)
+            row_ptr.append(len(cols))
+            servings.append(_servings(recipe.get('servings')))
+
+        self.rows = np.array(rows, dtype=np.int32)
+        self.cols = np.array(cols, dtype=np.int32)
+        self.dims = np.array(dims, dtype=np.int8)
+        self.amounts = np.array(amounts, dtype=np.float64)
+        self.row_ptr = np.array(row_ptr, dtype=np.int64)
+        self.servings = np.array(servings, dtype=np.float64)
+        self.sizes = np.diff(self.row_ptr)
+
+        # Word -> columns containing it, for matching pantry names to ingredient names
+        postings = {}
+        for key, col in self.vocab.items():
+            for word in set(key.split()):
+                postings.setdefault(word, []).append(col)
+        self._postings = postings
+        self._keys = [None] * len(self.names)
+        for key, col in self.vocab.items():
+            self._keys[col] = frozenset(key.split())
+
+    def __len__(self):
+        return len(self.titles)
+
+    def match(self, pantry_name):
+        """
+        Columns a pantry item can stand in for: every ingredient whose words contain
+        all of the item's words or vice versa ('chicken' ~ 'chicken breast'), the
+        same containment rule the frontend uses for its match percentages.
+        """
+        words = frozenset(normalize_name(pantry_name).split())
+        if not words:
+            return []
+        candidates = set()
+        for word in words:
+            candidates.update(self._postings.get(word, ()))
+        return [col for col in candidates if words <= self._keys[col] or self._keys[col] <= words]
+
+
+_libraries = OrderedDict()
+_libraries_lock = threading.Lock()
+
+
+def store_library(recipes):
+    """Index a recipe library and keep it for reuse. Returns (library_id, index)."""
+    index = RecipeIndex(recipes)
+    library_id = uuid.uuid4().hex
+    with _libraries_lock:
+        _libraries[library_id] = index
+        while len(_libraries) > LIBRARY_CACHE_SIZE:
+            _libraries.popitem(last=False)
+    return library_id, index
+
+
+def get_library(library_id):
+    """The index stored under library_id, or None if it was evicted (or lives in another worker)."""
+    with _libraries_lock:
+        index = _libraries.get(library_id)
+        if index is not None:
+            _libraries.move_to_end(library_id)
+        return index
+
+
+# ============================================================
+# PLANNING
+# ============================================================
+
+def _pantry_weights(pantry, today, days):
+    """Per pantry item: (days until expiry, weight)."""
+    horizon = max(days, EXPIRING_DAYS)
+    left = []
+    for item in pantry:
+        expiry = _parse_date(item.get('expiryDate'))
+        if expiry is not None:
+            days_left = (expiry - today).days
+        else:
+            shelf = SHELF_LIFE_DAYS.get(item.get('category') or 'other', SHELF_LIFE_DAYS['other'])
+            added = _parse_date(item.get('createdAt'))
+            days_left = shelf - ((today - added).days if added else 0)
+        left.append(days_left)
+    left = np.array(left, dtype=np.float64)
+    # Linear ramp: full boost for anything already due, none beyond the plan horizon
+    urgency = np.clip(1 - left / horizon, 0, 1)
+    return left, 1 + EXPIRY_WEIGHT * urgency
+
+
+def plan_meals(index, pantry, days=7, servings=None, today=None, allow_repeats=False):
+    """
+    Choose up to `days` recipes from `index` for the given pantry items (dicts with
+    name, quantity, unit, category, expiryDate). `servings` scales every recipe to
+    that many portions; by default recipes are cooked as written.
+
+    Returns {'plan': [...], 'shopping_list': [...], 'unused_expiring': [...], 'summary': {...}}.
+    """
+    if days < 1:
+        raise PlanError('days must be at least 1')
+    if servings is not None and not (math.isfinite(servings) and servings > 0):
+        raise PlanError('servings must be a positive number')
+    today = today or date.today()
+    pantry = [item for item in pantry if item.get('name') and isinstance(item['name'], str)]
+
+    days_left, item_weight = _pantry_weights(pantry, today, days)
+    remaining = np.full(len(pantry), np.nan)
+    remaining_dim = np.full(len(pantry), UNKNOWN, dtype=np.int8)
+    for p, item in enumerate(pantry):
+        remaining_dim[p], remaining[p] = to_base(item.get('quantity'), item.get('unit'))
+
+    # supplier[col] = pantry item that covers that ingredient (soonest to expire wins)
+    vocab_size = len(index.names)
+    supplier = np.full(vocab_size, -1, dtype=np.int64)
+    for p in np.argsort(-item_weight, kind='stable'):
+        cols = [c for c in index.match(pantry[p]['name']) if supplier[c] == -1]
+        supplier[cols] = p
+
+    used_up = np.zeros(len(pantry), dtype=bool)
+    on_list = np.zeros(vocab_size, dtype=bool)
+    chosen = np.zeros(len(index), dtype=bool)
+    # Recipes with nothing but staples have nothing to plan around
+    chosen[index.sizes == 0] = True
+
+    # Index -1 (no supplier) lands on the trailing 0
+    weight_or_zero = np.append(item_weight, 0.0)
+    plan = []
+    shopping = {}
+    for day in range(1, days + 1):
+        covered = supplier >= 0
+        covered[covered] = ~used_up[supplier[covered]]
+        value = np.where(covered, weight_or_zero[supplier], np.where(on_list, 0.0, -MISSING_PENALTY))
+        scores = np.bincount(index.rows, weights=value[index.cols], minlength=len(index))
+        scores[chosen] = -np.inf
+        best = int(np.argmax(scores))
+        if not np.isfinite(scores[best]):
+            break
+        if not allow_repeats:
+            chosen[best] = True
+
+        title = index.titles[best]
+        scale = 1.0
+        if servings is not None and index.servings[best] > 0:
+            scale = servings / index.servings[best]
+
+        uses, expiring_used, missing = [], [], []
+        start, end = index.row_ptr[best], index.row_ptr[best + 1]
+        for i in range(start, end):
+            col = index.cols[i]
+            need_dim, need = index.dims[i], index.amounts[i] * scale
+            p = supplier[col]
+            if p >= 0 and not used_up[p]:
+                shortfall = np.nan
+                if need_dim != UNKNOWN and need_dim == remaining_dim[p]:
+                    take = min(need, remaining[p])
+                    remaining[p] -= take
+                    shortfall = need - take
+                    used_up[p] = remaining[p] <= 1e-9
+                else:
+                    # Can't compare amounts (e.g. '1 bag' vs '2 cups'): assume this recipe uses it up
+                    used_up[p] = True
+                uses.append(pantry[p]['name'])
+                if days_left[p] <= EXPIRING_DAYS:
+                    expiring_used.append(pantry[p]['name'])
+                if shortfall > 1e-9:
+                    _add_to_list(shopping, index, col, need_dim, shortfall, title)
+                    missing.append(index.names[col])
+            else:
+                _add_to_list(shopping, index, col, need_dim, need, title)
+                on_list[col] = True
+                missing.append(index.names[col])
+
+        entry = {
+            'day': day,
+            'recipe_index': best,
+            'recipe_id': index.ids[best],
+            'recipe_title': title,
+            'scale': round(scale, 3),
+            'uses': uses,
+            'expiring_used': expiring_used,
+            'missing': missing,
+            'score': round(float(scores[best]), 3),
+        }
+        if servings is not None:
+            entry['servings'] = servings
+        plan.append(entry)
+
+    used_names = {name for entry in plan for name in entry['uses']}
+    unused_expiring = [item['name'] for p, item in enumerate(pantry)
+                       if days_left[p] <= EXPIRING_DAYS and item['name'] not in used_names]
+    shopping_list = sorted(shopping.values(), key=lambda item: item['name'].lower())
+    return {
+        'plan': plan,
+        'shopping_list': shopping_list,
+        'unused_expiring': unused_expiring,
+        'summary': {
+            'days_planned': len(plan),
+            'pantry_items_used': len(used_names),
+            'expiring_items_used': sum(len(entry['expiring_used']) for entry in plan),
+            'shopping_items': len(shopping_list),
+        },
+    }
+
+
+def _add_to_list(shopping, index, col, dimension, amount, title):
+    item = shopping.get(col)
+    if item is None:
+        item = shopping[col] = {'name': index.names[col], 'recipes': []}
+    if title and title not in item['recipes']:
+        item['recipes'].append(title)
+    if dimension == UNKNOWN or not np.isfinite(amount):
+        return
+    # Amounts are only totalled within one dimension; a second dimension is left as a note
+    if 'unit' not in item:
+        item['unit'] = _BASE_UNIT[dimension]
+        item['quantity'] = 0.0
+    if item['unit'] == _BASE_UNIT[dimension]:
+        item['quantity'] = round(item['quantity'] + float(amount), 2)
+
+
+if __name__ == "__main__":
+    import random
+    import time
+
+    rng = random.Random(7)
+    produce = ['tomato', 'spinach', 'broccoli', 'carrot', 'onion', 'garlic', 'bell pepper', 'zucchini',
+               'mushroom', 'potato', 'lemon', 'apple', 'banana', 'avocado', 'cucumber', 'kale']
+    proteins = ['chicken breast', 'ground beef', 'salmon', 'tofu', 'egg', 'shrimp', 'pork chop', 'black bean']
+    others = ['rice', 'pasta', 'flour', 'milk', 'butter', 'cheddar cheese', 'yogurt', 'olive oil',
+              'soy sauce', 'honey', 'bread', 'oat', 'tortilla', 'coconut milk', 'chickpea', 'quinoa']
+    extras = [f'{a}{b}{c} spice' for a in 'bcdfghjklmnp' for b in 'aeiou' for c in 'rstvwxz'][:3000]
+    units = [('2', 'count'), ('1', 'cup'), ('200', 'g'), ('1/2', 'lb'), ('2', 'tbsp'), ('1', 'bunch')]
+
+    def make_recipe(i):
+        names = rng.sample(produce, 3) + rng.sample(proteins, 1) + rng.sample(others, 3) + rng.sample(extras, 3)
+        return {
+            'recipe_title': f'Recipe {i}',
+            'servings': rng.choice([2, 4, 6]),
+            'ingredients': [dict(zip(('quantity', 'unit'), rng.choice(units)), name=n) for n in names] + [
+                {'name': 'Salt', 'quantity': 'to taste'}],
+        }
+
+    library = [make_recipe(i) for i in range(50_000)]
+    pantry = [
+        {'name': 'Spinach', 'quantity': 1, 'unit': 'bag', 'category': 'vegetable', 'expiryDate': '2026-01-19'},
+        {'name': 'Chicken Breast', 'quantity': 2, 'unit': 'lbs', 'category': 'protein', 'expiryDate': '2026-01-20'},
+        {'name': 'Tomatoes', 'quantity': 4, 'unit': 'count', 'category': 'vegetable', 'expiryDate': '2026-01-21'},
+        {'name': 'Milk', 'quantity': 1, 'unit': 'gallon', 'category': 'dairy', 'expiryDate': '2026-01-22'},
+        {'name': 'Eggs', 'quantity': 12, 'unit': 'count', 'category': 'protein'},
+        {'name': 'Rice', 'quantity': 5, 'unit': 'lbs', 'category': 'grain'},
+        {'name': 'Pasta', 'quantity': 2, 'unit': 'boxes', 'category': 'grain'},
+        {'name': 'Cheddar', 'quantity': 8, 'unit': 'oz', 'category': 'dairy', 'expiryDate': '2026-02-15'},
+        {'name': 'Onion', 'quantity': 3, 'unit': 'count', 'category': 'vegetable'},
+        {'name': 'Olive Oil', 'quantity': 1, 'unit': 'bottle', 'category': 'other'},
+    ]
+
+    start = time.perf_counter()
+    index = RecipeIndex(library)
+    built = time.perf_counter() - start
+    print(f"index: {len(index):,} recipes, {len(index.cols):,} entries, {len(index.names):,} ingredients "
+          f"in {built * 1000:.0f} ms")
+
+    start = time.perf_counter()
+    result = plan_meals(index, pantry, days=7, servings=2, today=date(2026, 1, 18))
+    elapsed = time.perf_counter() - start
+    for entry in result['plan']:
+        print(f"day {entry['day']}: {entry['recipe_title']:14s} score {entry['score']:6.2f}  "
+              f"uses {entry['uses']}  missing {len(entry['missing'])}")
+    print(result['summary'], 'unused expiring:', result['unused_expiring'])
+    print(f"7-day plan over {len(index):,} recipes: {elapsed * 1000:.1f} ms")
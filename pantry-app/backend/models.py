@@ -0,0 +1,277 @@
+"""
+Compact domain model for pantry items and recipes.
+
+Pantry rows and recipes used to be built as ad-hoc dicts per request. That's
+fine for a single response, but once pantries and recipe libraries are kept in
+memory a dict per item (plus a private copy of 'count', 'vegetable', 'Main'...
+in every one) dominates RSS. These classes use __slots__ so an instance is a
+small fixed-size struct, and the low-cardinality fields (category, unit,
+ingredient group) go through shared vocabularies so every item points at the
+same string object.
+
+to_dict()/from_dict() keep the exact JSON shape the frontend already uses.
+Run `python models.py` for a memory comparison at 1M ingredients.
+"""
+
+import csv
+import io
+
+
+class Vocabulary:
+    """
+    Interns a small set of repeated strings so instances share one object.
+    Units and groups are free text from the LLM, so the table stops growing at
+    max_size; values seen after that are kept as-is, just not shared.
+    """
+
+    __slots__ = ('_strings', 'max_size')
+
+    def __init__(self, initial=(), max_size=256):
+        self._strings = {s: s for s in initial}
+        self.max_size = max_size
+
+    def intern(self, value):
+        if value is None:
+            return None
+        canonical = self._strings.get(value)
+        if canonical is not None:
+            return canonical
+        if len(self._strings) < self.max_size:
+            self._strings[value] = value
+        return value
+
+    def __len__(self):
+        return len(self._strings)
+
+    def __contains__(self, value):
+        return value in self._strings
+
+
+# Category mapping for frontend compatibility
+CATEGORY_MAP = {
+    'Proteins': 'protein',
+    'Dairy': 'dairy',
+    'Grains': 'grain',
+    'Fruits': 'fruit',
+    'Vegetables': 'vegetable',
+    'Other': 'other'
+}
+
+CATEGORIES = Vocabulary(['protein', 'dairy', 'grain', 'fruit', 'vegetable', 'other'])
+UNITS = Vocabulary(['count', 'g', 'kg', 'lb', 'lbs', 'oz', 'ml', 'l', 'cup', 'cups',
+                    'tbsp', 'tsp', 'tablespoon', 'tablespoons', 'teaspoon', 'teaspoons',
+                    'pinch', 'pieces', 'slices', 'whole', 'pounds'])
+GROUPS = Vocabulary(['Main'])
+
+
+class PantryItem:
+    __slots__ = ('id', 'name', 'quantity', 'unit', 'category', 'expiry_date')
+
+    def __init__(self, id, name, quantity=1, unit='count', category='other', expiry_date=None):
+        self.id = id
+        self.name = name
+        self.quantity = quantity
+        self.unit = UNITS.intern(unit or 'count')
+        self.category = CATEGORIES.intern(category or 'other')
+        self.expiry_date = expiry_date
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data.get('id'), data.get('name', 'Unknown Item'), data.get('quantity', 1),
+                   data.get('unit'), data.get('category'), data.get('expiryDate'))
+
+    def to_dict(self):
+        data = {
+            'id': self.id,
+            'name': self.name,
+            'quantity': self.quantity,
+            'unit': self.unit,
+            'category': self.category
+        }
+        if self.expiry_date is not None:
+            data['expiryDate'] = self.expiry_date
+        return data
+
+    def __repr__(self):
+        return f'PantryItem({self.id!r}, {self.name!r}, {self.quantity!r} {self.unit}, {self.category})'
+
+
+def parse_receipt_csv(csv_text):
+    """Turn the receipt pipeline's CSV (food_name,quantity,unit,food_category) into PantryItems."""
+    items = []
+    if not csv_text:
+        return items
+    reader = csv.DictReader(io.StringIO(csv_text.strip()))
+    for idx, row in enumerate(reader):
+        # Map category to frontend format
+        raw_category = row.get('food_category', 'Other')
+        category = CATEGORY_MAP.get(raw_category, 'other')
+        
+        # Parse quantity
+        qty_str = row.get('quantity', '1')
+        try:
+            quantity = float(qty_str) if '.' in str(qty_str) else int(qty_str)
+        except (ValueError, TypeError):
+            quantity = 1
+        
+        # Parse unit (handle 'null' string)
+        unit = row.get('unit', 'count')
+        if unit == 'null' or not unit:
+            unit = 'count'
+        
+        items.append(PantryItem(idx + 1, row.get('food_name', 'Unknown Item'), quantity, unit, category))
+    return items
+
+
+class Ingredient:
+    __slots__ = ('name', 'quantity', 'unit', 'preparation_notes', 'group', 'extra')
+
+    # JSON keys handled by dedicated slots; anything else round-trips through `extra`
+    _KNOWN = frozenset(['name', 'quantity', 'unit', 'preparation_notes', 'group'])
+
+    def __init__(self, name, quantity='', unit=None, preparation_notes=None, group='Main', extra=None):
+        self.name = name
+        self.quantity = quantity
+        self.unit = UNITS.intern(unit)
+        self.preparation_notes = preparation_notes
+        self.group = GROUPS.intern(group or 'Main')
+        self.extra = extra or None
+
+    @classmethod
+    def from_dict(cls, data):
+        extra = {k: v for k, v in data.items() if k not in cls._KNOWN}
+        return cls(data['name'], data.get('quantity', ''), data.get('unit'),
+                   data.get('preparation_notes'), data.get('group'), extra)
+
+    def to_dict(self):
+        data = {'name': self.name, 'quantity': self.quantity}
+        if self.unit is not None:
+            data['unit'] = self.unit
+        if self.preparation_notes is not None:
+            data['preparation_notes'] = self.preparation_notes
+        data['group'] = self.group
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    def __repr__(self):
+        return f'Ingredient({self.name!r}, {self.quantity!r}, {self.unit!r})'
+
+
+class Instruction:
+    __slots__ = ('step_number', 'instruction_text')
+
+    def __init__(self, step_number, instruction_text):
+        self.step_number = step_number
+        self.instruction_text = instruction_text
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['step_number'], data['instruction_text'])
+
+    def to_dict(self):
+        return {'step_number': self.step_number, 'instruction_text': self.instruction_text}
+
+    def __repr__(self):
+        return f'Instruction({self.step_number}, {self.instruction_text[:30]!r})'
+
+
+class Recipe:
+    __slots__ = ('id', 'recipe_title', 'description', 'prep_time_minutes', 'cook_time_minutes',
+                 'servings', 'ingredients', 'instructions', 'source', 'source_url', 'extra')
+
+    # JSON keys handled by dedicated slots; anything else round-trips through `extra`
+    _KNOWN = frozenset(['id', 'recipe_title', 'description', 'prep_time_minutes', 'cook_time_minutes',
+                        'servings', 'ingredients', 'instructions', 'source', 'sourceUrl'])
+
+    def __init__(self, recipe_title, ingredients=(), instructions=(), description=None,
+                 prep_time_minutes=None, cook_time_minutes=None, servings=None,
+                 id=None, source=None, source_url=None, extra=None):
+        self.id = id
+        self.recipe_title = recipe_title
+        self.description = description
+        self.prep_time_minutes = prep_time_minutes
+        self.cook_time_minutes = cook_time_minutes
+        self.servings = servings
+        self.ingredients = tuple(ingredients)
+        self.instructions = tuple(instructions)
+        self.source = source
+        self.source_url = source_url
+        self.extra = extra or None
+
+    @classmethod
+    def from_dict(cls, data):
+        extra = {k: v for k, v in data.items() if k not in cls._KNOWN}
+        return cls(
+            data['recipe_title'],
+            [Ingredient.from_dict(i) for i in data.get('ingredients', ())],
+            [Instruction.from_dict(s) for s in data.get('instructions', ())],
+            description=data.get('description'),
+            prep_time_minutes=data.get('prep_time_minutes'),
+            cook_time_minutes=data.get('cook_time_minutes'),
+            servings=data.get('servings'),
+            id=data.get('id'),
+            source=data.get('source'),
+            source_url=data.get('sourceUrl'),
+            extra=extra,
+        )
+
+    def to_dict(self):
+        data = {'recipe_title': self.recipe_title}
+        for key in ('description', 'prep_time_minutes', 'cook_time_minutes', 'servings'):
+            value = getattr(self, key)
+            if value is not None:
+                data[key] = value
+        data['ingredients'] = [i.to_dict() for i in self.ingredients]
+        data['instructions'] = [s.to_dict() for s in self.instructions]
+        if self.extra:
+            data.update(self.extra)
+        if self.id is not None:
+            data['id'] = self.id
+        if self.source is not None:
+            data['source'] = self.source
+        if self.source_url is not None:
+            data['sourceUrl'] = self.source_url
+        return data
+
+    def __repr__(self):
+        return f'Recipe({self.recipe_title!r}, {len(self.ingredients)} ingredients, {len(self.instructions)} steps)'
+
+
+if __name__ == "__main__":
+    import gc
+    import json
+    import time
+    import tracemalloc
+
+    COUNT = 1_000_000
+    BATCH = 1000
+    units = ['cup', 'tbsp', 'g', 'count', 'pinch']
+    groups = ['Main', 'Sauce', 'Garnish']
+    # Each batch is parsed separately, like recipes arriving from different pipeline runs
+    batch_text = json.dumps([
+        {'name': f'ingredient {i}', 'quantity': str(i % 7 + 1), 'unit': units[i % 5],
+         'preparation_notes': 'finely chopped', 'group': groups[i % 3]}
+        for i in range(BATCH)
+    ])
+
+    def measure(label, build):
+        gc.collect()
+        tracemalloc.start()
+        start = time.perf_counter()
+        items = build()
+        elapsed = time.perf_counter() - start
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{label:10s} {current / 1024 / 1024:7.1f} MiB  {current / len(items):6.1f} B/ingredient  built in {elapsed:.2f}s")
+        return items
+
+    dicts = measure('dicts', lambda: [d for _ in range(COUNT // BATCH) for d in json.loads(batch_text)])
+    del dicts
+    slotted = measure('__slots__', lambda: [Ingredient.from_dict(d) for _ in range(COUNT // BATCH)
+                                            for d in json.loads(batch_text)])
+
+    start = time.perf_counter()
+    for ingredient in slotted[:100000]:
+        ingredient.to_dict()
+    print(f"to_dict: {100000 / (time.perf_counter() - start):,.0f} ingredients/s")
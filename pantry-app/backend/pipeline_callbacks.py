@@ -0,0 +1,169 @@
+"""
+Webhook completion mode for Gumloop runs.
+
+When GUMLOOP_CALLBACK_URL is set, start_pipeline passes it to the pipeline as a
+`callback_url` input and the pipeline's last step POSTs {"run_id": ...} to
+/api/gumloop/callback. That wakes the request waiting in get_pipeline_data
+through an in-process event, so it fetches the finished run right away instead
+of discovering it on the next 2 s poll. Polling is kept as a slow safety net
+(every GUMLOOP_CALLBACK_POLL_INTERVAL seconds) in case a callback is lost.
+
+The callback is sent by the pipeline's last step, slightly before Gumloop marks
+the run DONE, so the first poll after a wake can still see RUNNING. From then on
+the waiter polls quickly (0.25 s, doubling up to the normal 2 s) instead of
+falling back to the slow interval.
+
+Callbacks can arrive before the waiter registers (fast runs) or after it has
+finished (retries, late deliveries). Early ones are held briefly so the waiter
+sees them on registration; late and repeated ones are counted and ignored.
+
+Without GUMLOOP_CALLBACK_URL everything behaves exactly like plain polling.
+"""
+
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict
+
+CALLBACK_URL = os.getenv('GUMLOOP_CALLBACK_URL')
+CALLBACK_SECRET = os.getenv('GUMLOOP_CALLBACK_SECRET')
+POLL_INTERVAL = 2
+CALLBACK_POLL_INTERVAL = float(os.getenv('GUMLOOP_CALLBACK_POLL_INTERVAL', '20'))
+AFTER_CALLBACK_POLL_INTERVAL = 0.25
+
+_EARLY_TTL = 120.0
+_MAX_REMEMBERED = 1024
+
+_lock = threading.Lock()
+_waiters = {}              # run_id -> list of threading.Event, one per waiting request
+_early = OrderedDict()     # run_id -> arrival time, for callbacks before register()
+_finished = OrderedDict()  # run_id -> None, recently completed runs (dedup late callbacks)
+_stats = {'delivered': 0, 'early': 0, 'duplicate': 0, 'woken_by_callback': 0, 'woken_by_poll': 0}
+
+
+def enabled():
+    return bool(CALLBACK_URL)
+
+
+def poll_interval(polls_since_callback=None):
+    """
+    Seconds to wait before the next status poll. polls_since_callback is None until
+    the run's callback has arrived, then counts the polls made since.
+    """
+    if not enabled():
+        return POLL_INTERVAL
+    if polls_since_callback is None:
+        return CALLBACK_POLL_INTERVAL
+    return min(POLL_INTERVAL, AFTER_CALLBACK_POLL_INTERVAL * 2 ** polls_since_callback)
+
+
+def pipeline_inputs():
+    """Extra pipeline_inputs to send with start_pipeline when callbacks are on."""
+    if not enabled():
+        return []
+    return [{"input_name": "callback_url", "value": CALLBACK_URL}]
+
+
+def register(run_id):
+    """Start listening for a run's completion. Returns the Event to wait on."""
+    event = threading.Event()
+    with _lock:
+        _waiters.setdefault(run_id, []).append(event)
+        _finished.pop(run_id, None)
+        if _early.pop(run_id, None) is not None:
+            event.set()
+    return event
+
+
+def wait(run_id, event, timeout):
+    """Sleep until the run's callback arrives or timeout elapses. Returns True if woken by callback."""
+    woke = event.wait(max(0.0, timeout))
+    with _lock:
+        _stats['woken_by_callback' if woke else 'woken_by_poll'] += 1
+        # Only consume a wake we actually saw, so a callback racing a poll timeout isn't lost
+        if woke:
+            event.clear()
+    return woke
+
+
+def unregister(run_id, event):
+    with _lock:
+        events = _waiters.get(run_id, [])
+        if event in events:
+            events.remove(event)
+        if not events:
+            _waiters.pop(run_id, None)
+            _remember(_finished, run_id)
+
+
+def notify(run_id):
+    """
+    Deliver a completion callback. Returns 'delivered', 'early' or 'duplicate'.
+    """
+    now = time.monotonic()
+    with _lock:
+        events = _waiters.get(run_id)
+        if events:
+            if all(event.is_set() for event in events):
+                _stats['duplicate'] += 1
+                return 'duplicate'
+            for event in events:
+                event.set()
+            _stats['delivered'] += 1
+            return 'delivered'
+
+        if run_id in _finished:
+            _stats['duplicate'] += 1
+            return 'duplicate'
+
+        # Nobody waiting yet: hold it for a while in case the waiter is about to register
+        for stale_id, arrived in list(_early.items()):
+            if now - arrived < _EARLY_TTL:
+                break
+            del _early[stale_id]
+        if run_id in _early:
+            _stats['duplicate'] += 1
+            return 'duplicate'
+        _early[run_id] = now
+        while len(_early) > _MAX_REMEMBERED:
+            _early.popitem(last=False)
+        _stats['early'] += 1
+        return 'early'
+
+
+def check_secret(provided):
+    # Constant-time compare so response timing doesn't leak how much of a guess was right
+    return not CALLBACK_SECRET or hmac.compare_digest((provided or '').encode('utf-8'), CALLBACK_SECRET.encode('utf-8'))
+
+
+def stats():
+    with _lock:
+        return dict(_stats, enabled=enabled(), waiting=len(_waiters))
+
+
+def _remember(ordered, key):
+    ordered[key] = None
+    ordered.move_to_end(key)
+    while len(ordered) > _MAX_REMEMBERED:
+        ordered.popitem(last=False)
+
+
+if __name__ == "__main__":
+    # Local stand-in for Gumloop: a thread fires the callback (twice) while we wait
+    run_id = "local-test-run"
+    event = register(run_id)
+
+    def fake_gumloop():
+        time.sleep(0.5)
+        print("callback ->", notify(run_id))
+        print("callback ->", notify(run_id))
+
+    threading.Thread(target=fake_gumloop).start()
+    start = time.time()
+    woke = wait(run_id, event, timeout=10)
+    unregister(run_id, event)
+    print(f"Woken by callback: {woke} after {time.time() - start:.2f}s")
+    time.sleep(0.1)
+    print("late callback ->", notify(run_id))
+    print(stats())
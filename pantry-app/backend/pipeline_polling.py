@@ -0,0 +1,78 @@
+"""
+Polling a started Gumloop run until it finishes.
+
+Shared by receipt_upload, recipe_provided and recipe_suggest, which differ only
+in how they start a run and which output they read. wait_for_run() polls
+get_pl_run through the circuit breaker (polls count in its separate poll
+window), sleeps on the completion webhook between polls (see
+pipeline_callbacks), and stops quietly when a hedged duplicate has already won.
+"""
+
+import time
+
+import requests
+
+from circuit_breaker import gumloop_breaker
+import pipeline_callbacks
+
+
+def wait_for_run(response, user_id, api_key, max_wait_time=300, cancel=None):
+    """
+    Poll the run in a start_pipeline response until it is DONE and return the run data.
+    Raises TimeoutError after max_wait_time seconds; returns None if `cancel` gets set.
+    """
+    run_id = response.get("run_id")
+    if not run_id:
+        raise ValueError("No run_id found in pipeline response")
+
+    url = f"https://api.gumloop.com/api/v1/get_pl_run?run_id={run_id}&user_id={user_id}"
+
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+    }
+
+    start_time = time.time()
+    completion = pipeline_callbacks.register(run_id)
+    polls_since_callback = None
+    try:
+        while True:
+            # Stop quietly once a hedged duplicate of this run has already won
+            if cancel is not None and cancel.is_set():
+                return None
+
+            # Check timeout
+            if time.time() - start_time > max_wait_time:
+                gumloop_breaker.record_failure(timeout=True)
+                raise TimeoutError(f"Pipeline did not complete within {max_wait_time} seconds")
+    
+            try:
+                response = gumloop_breaker.request('GET', url, headers=headers, timeout=30, poll=True)
+                response.raise_for_status()
+            except requests.exceptions.RequestException as e:
+                raise Exception(f"Error checking pipeline status: {str(e)}")
+    
+            try:
+                data = response.json()
+            except ValueError as e:
+                raise Exception(f"Invalid JSON response from pipeline status: {str(e)}")
+    
+            state = data.get("state")
+            if state == "DONE":
+                gumloop_breaker.record_success()
+                break
+            elif state == "FAILED" or state == "ERROR":
+                error_msg = data.get("error", "Unknown error")
+                gumloop_breaker.record_failure()
+                raise Exception(f"Pipeline failed with state {state}: {error_msg}")
+    
+            # Sleep until the next poll, or until the completion webhook wakes us
+            remaining = max_wait_time - (time.time() - start_time)
+            interval = pipeline_callbacks.poll_interval(polls_since_callback)
+            if pipeline_callbacks.wait(run_id, completion, min(interval, remaining)):
+                polls_since_callback = 0
+            elif polls_since_callback is not None:
+                polls_since_callback += 1
+    finally:
+        pipeline_callbacks.unregister(run_id, completion)
+
+    return data
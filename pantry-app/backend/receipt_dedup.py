@@ -0,0 +1,264 @@
+"""
+Near-duplicate receipt detection.
+
+Exact-byte matching misses the same receipt uploaded again after being
+resized, recompressed or re-exposed. We compute a 64-bit difference hash
+(dHash) of every uploaded receipt with Pillow and keep a per-user multi-index
+hash table of recently processed receipts. An earlier receipt within
+RECEIPT_DUP_DISTANCE bits (Hamming distance) is only a candidate: the 9x8
+thumbnail sees the paper's outline and the background, so two receipts from the
+same store shot the same way are just a few bits apart. A candidate counts as a
+duplicate only if a 256-bit content hash (16x16, fine enough to see where the
+printed lines fall) is also within RECEIPT_DUP_CONFIRM_DISTANCE bits. Anything
+else runs the OCR pipeline; a missed duplicate only costs a run.
+
+Run `python receipt_dedup.py` to benchmark hash distances over variants of the
+bundled receipt images and index lookups against a linear scan.
+"""
+
+import os
+import threading
+import time
+
+from PIL import Image, ImageOps
+
+DUP_DISTANCE = int(os.getenv('RECEIPT_DUP_DISTANCE', '10'))
+CONFIRM_DISTANCE = int(os.getenv('RECEIPT_DUP_CONFIRM_DISTANCE', '8'))
+RECENT_SECONDS = float(os.getenv('RECEIPT_DUP_WINDOW', str(7 * 24 * 3600)))
+MAX_PER_USER = 500
+
+
+def dhash(image, size=8):
+    """64-bit difference hash: is each pixel brighter than its right neighbour on a 9x8 thumbnail."""
+    image = ImageOps.exif_transpose(image)
+    gray = image.convert('L').resize((size + 1, size), Image.LANCZOS)
+    pixels = gray.tobytes()
+    value = 0
+    for row in range(size):
+        offset = row * (size + 1)
+        for col in range(size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def content_hash(image, size=16):
+    """256-bit dHash of the contrast-normalized receipt; shifts when the printed lines do."""
+    image = ImageOps.exif_transpose(image)
+    gray = ImageOps.autocontrast(image.convert('L'), cutoff=1).resize((size + 1, size), Image.BOX)
+    pixels = gray.tobytes()
+    value = 0
+    for row in range(size):
+        offset = row * (size + 1)
+        for col in range(size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def dhash_file(path):
+    with Image.open(path) as image:
+        # Decoding at reduced size is much cheaper for big phone photos
+        image.draft('L', (image.width // 8 or 1, image.height // 8 or 1))
+        return dhash(image)
+
+
+def fingerprint_file(path):
+    """(dhash, content_hash) of an image file, from one decode."""
+    with Image.open(path) as image:
+        image.draft('L', (image.width // 8 or 1, image.height // 8 or 1))
+        image.load()
+        return dhash(image), content_hash(image)
+
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+
+class HammingIndex:
+    """
+    Multi-index hash table for Hamming-radius lookups over 64-bit hashes.
+
+    The hash is split into `chunks` 16-bit pieces, each with its own table. If two
+    hashes differ in at most r bits, at least one piece differs in at most
+    r // chunks bits (pigeonhole), so we only probe each table with the few
+    chunk values within that small radius and verify the candidates.
+    """
+
+    def __init__(self, max_distance=DUP_DISTANCE, bits=64, chunks=4):
+        self.max_distance = max_distance
+        self.chunks = chunks
+        self.chunk_bits = bits // chunks
+        self._chunk_mask = (1 << self.chunk_bits) - 1
+        self._tables = [{} for _ in range(chunks)]
+        self._flips = _flip_masks(self.chunk_bits, max_distance // chunks)
+        self.size = 0
+
+    def _pieces(self, key):
+        return [(key >> (i * self.chunk_bits)) & self._chunk_mask for i in range(self.chunks)]
+
+    def add(self, key, value):
+        entry = (key, value)
+        for table, piece in zip(self._tables, self._pieces(key)):
+            table.setdefault(piece, []).append(entry)
+        self.size += 1
+
+    def search(self, key, max_distance=None):
+        """All (distance, hash, value) within max_distance, closest first."""
+        if max_distance is None or max_distance > self.max_distance:
+            max_distance = self.max_distance
+        found = {}
+        for table, piece in zip(self._tables, self._pieces(key)):
+            for flip in self._flips:
+                for entry in table.get(piece ^ flip, ()):
+                    if id(entry) not in found:
+                        found[id(entry)] = (hamming(key, entry[0]), entry)
+        matches = [(d, e[0], e[1]) for d, e in found.values() if d <= max_distance]
+        matches.sort(key=lambda match: match[0])
+        return matches
+
+
+def _flip_masks(bits, radius):
+    """Every bit mask of width `bits` with at most `radius` bits set."""
+    masks = [0]
+    frontier = [(0, -1)]
+    for _ in range(radius):
+        next_frontier = []
+        for mask, highest in frontier:
+            for bit in range(highest + 1, bits):
+                flipped = mask | (1 << bit)
+                masks.append(flipped)
+                next_frontier.append((flipped, bit))
+        frontier = next_frontier
+    return masks
+
+
+class ReceiptIndex:
+    """
+    Per-user index of recently processed receipts keyed by perceptual hash.
+    Fingerprints are (dhash, content_hash) pairs from fingerprint_file().
+    """
+
+    def __init__(self, max_distance=DUP_DISTANCE, recent_seconds=RECENT_SECONDS, max_per_user=MAX_PER_USER,
+                 confirm_distance=CONFIRM_DISTANCE):
+        self.max_distance = max_distance
+        self.confirm_distance = confirm_distance
+        self.recent_seconds = recent_seconds
+        self.max_per_user = max_per_user
+        self._lock = threading.Lock()
+        self._entries = {}   # user_key -> list of (added_at, hash, result, content hash)
+        self._indexes = {}   # user_key -> HammingIndex
+
+    def lookup(self, user_key, fingerprint):
+        """Closest recent receipt for this user as (distance, result), or None."""
+        image_hash, content = fingerprint
+        with self._lock:
+            index = self._indexes.get(user_key)
+            if index is None:
+                return None
+            cutoff = time.time() - self.recent_seconds
+            for distance, _, entry in index.search(image_hash, self.max_distance):
+                # Same layout isn't enough; the printed lines have to line up too
+                if entry[0] >= cutoff and hamming(content, entry[3]) <= self.confirm_distance:
+                    return distance, entry[2]
+            return None
+
+    def add(self, user_key, fingerprint, result):
+        image_hash, content = fingerprint
+        with self._lock:
+            entries = self._entries.setdefault(user_key, [])
+            entry = (time.time(), image_hash, result, content)
+            entries.append(entry)
+            cutoff = time.time() - self.recent_seconds
+            if len(entries) > self.max_per_user or entries[0][0] < cutoff:
+                # Prune expired/excess entries and rebuild rather than deleting in place
+                entries[:] = [e for e in entries if e[0] >= cutoff][-self.max_per_user:]
+                index = HammingIndex(self.max_distance)
+                for e in entries:
+                    index.add(e[1], e)
+                self._indexes[user_key] = index
+            else:
+                if user_key not in self._indexes:
+                    self._indexes[user_key] = HammingIndex(self.max_distance)
+                self._indexes[user_key].add(image_hash, entry)
+
+
+if __name__ == "__main__":
+    import io
+    import random
+    from PIL import ImageChops, ImageEnhance
+
+    RECEIPTS = ["receipt.jpg", "receipt2.jpg", "receipt3.jpeg"]
+
+    def shifted_band(image, dy):
+        # Same layout, different items: move the middle text band down by dy pixels
+        w, h = image.size
+        top, bottom = int(h * .3), int(h * .7)
+        out = image.copy()
+        out.paste(ImageChops.offset(image.crop((0, top, w, bottom)), 0, dy), (0, top))
+        return out
+
+    def variants(image):
+        w, h = image.size
+        jpeg = io.BytesIO()
+        image.save(jpeg, 'JPEG', quality=40)
+        return {
+            'rotate 2deg': image.rotate(2, fillcolor=(128, 128, 128)),
+            'rotate -3deg': image.rotate(-3, fillcolor=(255, 255, 255)),
+            'crop 3%': image.crop((int(w * .03), int(h * .03), int(w * .97), int(h * .97))),
+            'downscale 2/3': image.resize((w * 2 // 3, h * 2 // 3)),
+            'brighter': ImageEnhance.Brightness(image).enhance(1.2),
+            'jpeg q40': Image.open(io.BytesIO(jpeg.getvalue())),
+        }
+
+    def fingerprint(image):
+        return dhash(image), content_hash(image)
+
+    print(f"Hamming distance to the original as (64-bit dHash, 256-bit content hash); "
+          f"duplicate needs <= ({DUP_DISTANCE}, {CONFIRM_DISTANCE}):")
+    originals = {}
+    false_matches = 0
+    for name in RECEIPTS:
+        with Image.open(name) as image:
+            image.load()
+        originals[name] = fingerprint(image)
+        start = time.perf_counter()
+        for _ in range(20):
+            fingerprint_file(name)
+        per_hash = (time.perf_counter() - start) / 20 * 1000
+        index = ReceiptIndex()
+        index.add('user', originals[name], name)
+        cases = dict(variants(image), **{f'text shifted {dy}px': shifted_band(image, dy) for dy in (15, 40, 80)})
+        print(f"  {name} (fingerprint {per_hash:.1f} ms)")
+        for label, variant in cases.items():
+            fp = fingerprint(variant)
+            verdict = 'duplicate' if index.lookup('user', fp) else 'new'
+            if verdict == 'duplicate' and label.startswith('text shifted'):
+                false_matches += 1
+            print(f"    {label:20s} ({hamming(originals[name][0], fp[0]):2d}, "
+                  f"{hamming(originals[name][1], fp[1]):3d})  {verdict}")
+
+    print("Distance between different receipts:")
+    for i, a in enumerate(RECEIPTS):
+        for b in RECEIPTS[i + 1:]:
+            print(f"  {a} vs {b}: ({hamming(originals[a][0], originals[b][0])}, "
+                  f"{hamming(originals[a][1], originals[b][1])})")
+    print(f"Different text reported as duplicate: {false_matches}")
+
+    # Per-user indexes are capped at MAX_PER_USER; also show a much larger index
+    random.seed(0)
+    for count in (MAX_PER_USER, 100000):
+        hashes = [random.getrandbits(64) for _ in range(count)]
+        index = HammingIndex(DUP_DISTANCE)
+        for h in hashes:
+            index.add(h, None)
+        queries = [h ^ (1 << random.randrange(64)) for h in random.sample(hashes, 200)]
+
+        start = time.perf_counter()
+        for q in queries:
+            index.search(q, DUP_DISTANCE)
+        index_ms = (time.perf_counter() - start) / len(queries) * 1000
+
+        start = time.perf_counter()
+        for q in queries[:20]:
+            [h for h in hashes if hamming(q, h) <= DUP_DISTANCE]
+        scan_ms = (time.perf_counter() - start) / 20 * 1000
+        print(f"Lookup over {count} hashes: multi-index {index_ms:.3f} ms, linear scan {scan_ms:.3f} ms")
@@ -0,0 +1,145 @@
+"""
+Pre-flight checks for uploaded receipts.
+
+Every receipt that reaches Gumloop costs a multi-second OCR run, so we reject
+obviously unusable uploads locally first, in a few milliseconds:
+
+* size     - file is empty or larger than RECEIPT_MAX_BYTES
+* format   - Pillow can identify it from the header and it's an allowed format
+             (HEIC/HEIF needs pillow-heif; without it such photos skip the
+             image checks and go straight to the pipeline as before)
+* dims     - width/height within sane bounds (header only, no full decode)
+* decode   - a reduced-size decode succeeds (catches truncated files)
+* contrast - standard deviation of a small grayscale thumbnail (blank pages)
+* blur     - variance of the Laplacian on the same thumbnail
+
+preflight() returns per-check timings in milliseconds, or raises
+PreflightError carrying the same report plus the failed check.
+"""
+
+import os
+import time
+
+from PIL import Image, ImageFilter, ImageStat
+
+try:
+    from pillow_heif import register_heif_opener
+    register_heif_opener()
+    HEIF_SUPPORTED = True
+except ImportError:
+    HEIF_SUPPORTED = False
+
+MAX_BYTES = int(os.getenv('RECEIPT_MAX_BYTES', str(15 * 1024 * 1024)))
+MIN_SIDE = 200
+MAX_PIXELS = 60_000_000
+ALLOWED_FORMATS = {'JPEG', 'MPO', 'PNG', 'WEBP', 'BMP', 'TIFF', 'GIF', 'HEIF'}
+# ISO-BMFF brands used by iPhone HEIC/HEIF photos
+HEIF_BRANDS = {b'heic', b'heix', b'hevc', b'hevx', b'heim', b'heis', b'mif1', b'msf1'}
+THUMBNAIL_SIZE = 512
+# Calibrated on the bundled receipts: sharp photos score ~2000-3000, a 2px Gaussian blur drops them to ~20-500
+BLUR_THRESHOLD = float(os.getenv('RECEIPT_BLUR_THRESHOLD', '30'))
+CONTRAST_THRESHOLD = float(os.getenv('RECEIPT_CONTRAST_THRESHOLD', '12'))
+
+_LAPLACIAN = ImageFilter.Kernel((3, 3), [0, 1, 0, 1, -4, 1, 0, 1, 0], scale=1, offset=128)
+
+
+def _is_heif(path):
+    with open(path, 'rb') as f:
+        header = f.read(12)
+    return header[4:8] == b'ftyp' and header[8:12] in HEIF_BRANDS
+
+
+class PreflightError(Exception):
+    def __init__(self, message, check, report):
+        super().__init__(message)
+        self.check = check
+        self.report = report
+
+
+def preflight(path):
+    """Validate a receipt image on disk. Returns a report dict or raises PreflightError."""
+    timings = {}
+    report = {'timings_ms': timings}
+    clock = time.perf_counter()
+
+    def lap(name):
+        nonlocal clock
+        now = time.perf_counter()
+        timings[name] = round((now - clock) * 1000, 2)
+        clock = now
+
+    def fail(check, message):
+        lap(check)
+        report['failed_check'] = check
+        report['total_ms'] = round(sum(timings.values()), 2)
+        raise PreflightError(message, check, report)
+
+    size = os.path.getsize(path)
+    report['bytes'] = size
+    if size == 0:
+        fail('size', 'Uploaded file is empty')
+    if size > MAX_BYTES:
+        fail('size', f'Receipt image is too large ({size // 1024} KB, limit {MAX_BYTES // 1024} KB)')
+    lap('size')
+
+    try:
+        image = Image.open(path)
+    except Exception:
+        if not HEIF_SUPPORTED and _is_heif(path):
+            # Can't decode it here, but the pipeline can: let it through unchecked
+            report['format'] = 'HEIF'
+            report['skipped'] = 'image checks need pillow-heif'
+            lap('format')
+            report['total_ms'] = round(sum(timings.values()), 2)
+            return report
+        fail('format', 'File is not a recognized image')
+    with image:
+        report['format'] = image.format
+        if image.format not in ALLOWED_FORMATS:
+            fail('format', f'Unsupported image format: {image.format}')
+        lap('format')
+
+        width, height = image.size
+        report['width'], report['height'] = width, height
+        if min(width, height) < MIN_SIDE:
+            fail('dims', f'Image is too small ({width}x{height}); receipts need at least {MIN_SIDE}px per side')
+        if width * height > MAX_PIXELS:
+            fail('dims', f'Image has too many pixels ({width}x{height})')
+        lap('dims')
+
+        try:
+            # JPEG can decode straight to a scaled-down grayscale image, which is far cheaper
+            image.draft('L', (THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+            thumb = image.convert('L')
+            thumb.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        except Exception:
+            fail('decode', 'Image data is corrupt or truncated')
+        lap('decode')
+
+    contrast = ImageStat.Stat(thumb).stddev[0]
+    report['contrast'] = round(contrast, 1)
+    if contrast < CONTRAST_THRESHOLD:
+        fail('contrast', 'Image looks blank; make sure the receipt fills the photo')
+    lap('contrast')
+
+    laplacian = thumb.filter(_LAPLACIAN)
+    # The kernel leaves a 1px border untouched, which would skew the variance
+    laplacian = laplacian.crop((1, 1, laplacian.width - 1, laplacian.height - 1))
+    sharpness = ImageStat.Stat(laplacian).var[0]
+    report['sharpness'] = round(sharpness, 1)
+    if sharpness < BLUR_THRESHOLD:
+        fail('blur', 'Image is too blurry to read; try holding the camera steady')
+    lap('blur')
+
+    report['total_ms'] = round(sum(timings.values()), 2)
+    return report
+
+
+if __name__ == "__main__":
+    import sys
+
+    for path in sys.argv[1:] or ["receipt.jpg", "receipt2.jpg", "receipt3.jpeg"]:
+        try:
+            print(path, preflight(path))
+        except PreflightError as e:
+            print(path, f"REJECTED ({e.check}): {e}", e.report)
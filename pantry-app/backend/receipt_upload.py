@@ -2,12 +2,18 @@ from dotenv import load_dotenv
 import requests
 import os
 import base64
-import time
 from PIL import Image  
+from circuit_breaker import gumloop_breaker
+import pipeline_callbacks
+import pipeline_polling
+import run_journal
+import hedging
+import shared_cache
 
 
 load_dotenv(override=True)
 gumloop_api_key = os.getenv('GUMLOOP')
+GUMLOOP_SAVED_ITEM_ID = "vezQxjRcmZY43i7KWchyKw"
 
 # Don't crash on import - defer error to runtime when the key is actually needed
 def _check_api_key():
@@ -45,7 +51,7 @@ def upload_image_to_gumloop(image_path, user_id):
     
     # Make the request
     try:
-        response = requests.post(url, json=payload, headers=headers, timeout=30)
+        response = gumloop_breaker.request('POST', url, json=payload, headers=headers, timeout=30)
         response.raise_for_status()
     except requests.exceptions.Timeout:
         raise Exception("Upload request timed out")
@@ -79,7 +85,7 @@ def start_pipeline(file_name, user_id, saved_item_id):
                 "input_name": "file_name",
                 "value": f"{file_name}"
             }
-        ]
+        ] + pipeline_callbacks.pipeline_inputs()
     }
     
     headers = {
@@ -90,7 +96,7 @@ def start_pipeline(file_name, user_id, saved_item_id):
     # Make the request
     print(f"Starting pipeline with file: {file_name}")
     try:
-        response = requests.post(url, json=payload, headers=headers, timeout=30)
+        response = gumloop_breaker.request('POST', url, json=payload, headers=headers, timeout=30)
         response.raise_for_status()
     except requests.exceptions.Timeout:
         raise Exception("Pipeline start request timed out")
@@ -102,53 +108,50 @@ def start_pipeline(file_name, user_id, saved_item_id):
     except ValueError as e:
         raise Exception(f"Invalid JSON response from pipeline start: {str(e)}")
 
-def get_pipeline_data(response, user_id, max_wait_time=300):
-    run_id = response.get("run_id")
-    if not run_id:
-        raise ValueError("No run_id found in pipeline response")
-    
-    url = f"https://api.gumloop.com/api/v1/get_pl_run?run_id={run_id}&user_id={user_id}"
+def get_pipeline_data(response, user_id, max_wait_time=300, cancel=None):
+    return pipeline_polling.wait_for_run(response, user_id, gumloop_api_key, max_wait_time, cancel)
 
-    headers = {
-        "Authorization": f"Bearer {gumloop_api_key}",
-    }
+def _run_key(image_path):
+    if not os.path.exists(image_path):
+        raise FileNotFoundError(f"Image file not found: {image_path}")
+    with open(image_path, 'rb') as file:
+        return run_journal.inputs_hash(GUMLOOP_SAVED_ITEM_ID, file.read())
 
-    start_time = time.time()
-    while True:
-        # Check timeout
-        if time.time() - start_time > max_wait_time:
-            raise TimeoutError(f"Pipeline did not complete within {max_wait_time} seconds")
-        
-        try:
-            response = requests.get(url, headers=headers, timeout=30)
-            response.raise_for_status()
-        except requests.exceptions.RequestException as e:
-            raise Exception(f"Error checking pipeline status: {str(e)}")
-        
-        try:
-            data = response.json()
-        except ValueError as e:
-            raise Exception(f"Invalid JSON response from pipeline status: {str(e)}")
-        
-        state = data.get("state")
-        if state == "DONE":
-            break
-        elif state == "FAILED" or state == "ERROR":
-            error_msg = data.get("error", "Unknown error")
-            raise Exception(f"Pipeline failed with state {state}: {error_msg}")
-        
-        time.sleep(2)
-    
-    return data
+
+def _forget(key):
+    shared_cache.cache.delete('receipt', key)
+    run_journal.invalidate('receipt', key)
+
+
+def invalidate(image_path):
+    """Drop the cached result for this image so the next upload runs OCR again."""
+    _forget(_run_key(image_path))
 
 
-def run_pipeline(image_path, user_id):
+def run_pipeline(image_path, user_id, fresh=False):
     # Upload image and start pipeline
-    GUMLOOP_SAVED_ITEM_ID = "vezQxjRcmZY43i7KWchyKw"
-    file_name = upload_image_to_gumloop(image_path, user_id)
-    pipeline_response = start_pipeline(file_name, user_id, GUMLOOP_SAVED_ITEM_ID)
-    result = get_pipeline_data(pipeline_response, user_id)
-    return result.get("outputs").get("receipt_text")
+    key = _run_key(image_path)
+    if fresh:
+        _forget(key)
+
+    uploaded = {}
+
+    def start():
+        # A hedged duplicate run reuses the already-uploaded file
+        if 'file_name' not in uploaded:
+            uploaded['file_name'] = upload_image_to_gumloop(image_path, user_id)
+        return start_pipeline(uploaded['file_name'], user_id, GUMLOOP_SAVED_ITEM_ID)
+
+    wait = hedging.hedged_wait('receipt', start,
+                               lambda response, cancel: get_pipeline_data(response, user_id, cancel=cancel))
+    outputs = shared_cache.cache.get_or_compute(
+        'receipt', key, lambda: run_journal.run('receipt', key, user_id, start, wait).get("outputs"),
+        ttl=7 * 24 * 3600, validate=lambda outputs: bool(outputs.get("receipt_text")))
+    receipt_text = outputs.get("receipt_text")
+    if not receipt_text:
+        # Nothing usable came back; don't let the journal hand this run out again
+        run_journal.invalidate('receipt', key)
+    return receipt_text
     
 
 
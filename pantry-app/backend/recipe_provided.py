@@ -2,12 +2,18 @@ from dotenv import load_dotenv
 import requests
 import os
 import base64
-import time
 from PIL import Image  
+from circuit_breaker import gumloop_breaker
+import pipeline_callbacks
+import pipeline_polling
+import run_journal
+import hedging
+import shared_cache
 
 
 load_dotenv(override=True)
 gumloop_api_key = os.getenv('GUMLOOP')
+GUMLOOP_SAVED_ITEM_ID = "hqBPoCuJVrK2FTJ4ejFUqf"
 
 # Don't crash on import - defer error to runtime when the key is actually needed
 def _check_api_key():
@@ -29,7 +35,7 @@ def start_pipeline(recipe_link, user_id, saved_item_id):
                 "input_name": "recipe_link",
                 "value": f"{recipe_link}"
             }
-        ]
+        ] + pipeline_callbacks.pipeline_inputs()
     }
     
     headers = {
@@ -40,7 +46,7 @@ def start_pipeline(recipe_link, user_id, saved_item_id):
     # Make the request
     print(f"Starting pipeline with link: {recipe_link}")
     try:
-        response = requests.post(url, json=payload, headers=headers, timeout=30)
+        response = gumloop_breaker.request('POST', url, json=payload, headers=headers, timeout=30)
         response.raise_for_status()
     except requests.exceptions.Timeout:
         raise Exception("Pipeline start request timed out")
@@ -52,52 +58,35 @@ def start_pipeline(recipe_link, user_id, saved_item_id):
     except ValueError as e:
         raise Exception(f"Invalid JSON response from pipeline start: {str(e)}")
 
-def get_pipeline_data(response, user_id, max_wait_time=300):
-    run_id = response.get("run_id")
-    if not run_id:
-        raise ValueError("No run_id found in pipeline response")
-    
-    url = f"https://api.gumloop.com/api/v1/get_pl_run?run_id={run_id}&user_id={user_id}"
+def get_pipeline_data(response, user_id, max_wait_time=300, cancel=None):
+    return pipeline_polling.wait_for_run(response, user_id, gumloop_api_key, max_wait_time, cancel)
 
-    headers = {
-        "Authorization": f"Bearer {gumloop_api_key}",
-    }
+def _forget(key):
+    shared_cache.cache.delete('recipe', key)
+    run_journal.invalidate('recipe', key)
 
-    start_time = time.time()
-    while True:
-        # Check timeout
-        if time.time() - start_time > max_wait_time:
-            raise TimeoutError(f"Pipeline did not complete within {max_wait_time} seconds")
-        
-        try:
-            response = requests.get(url, headers=headers, timeout=30)
-            response.raise_for_status()
-        except requests.exceptions.RequestException as e:
-            raise Exception(f"Error checking pipeline status: {str(e)}")
-        
-        try:
-            data = response.json()
-        except ValueError as e:
-            raise Exception(f"Invalid JSON response from pipeline status: {str(e)}")
-        
-        state = data.get("state")
-        if state == "DONE":
-            break
-        elif state == "FAILED" or state == "ERROR":
-            error_msg = data.get("error", "Unknown error")
-            raise Exception(f"Pipeline failed with state {state}: {error_msg}")
-        
-        time.sleep(2)
-    
-    return data
+
+def invalidate(recipe_link):
+    """Drop the cached result for this link so the next import runs the pipeline again."""
+    _forget(run_journal.inputs_hash(GUMLOOP_SAVED_ITEM_ID, recipe_link))
 
 
-def run_pipeline(recipe_link, user_id):
+def run_pipeline(recipe_link, user_id, fresh=False):
     # Upload image and start pipeline
-    GUMLOOP_SAVED_ITEM_ID = "hqBPoCuJVrK2FTJ4ejFUqf"
-    pipeline_response = start_pipeline(recipe_link, user_id, GUMLOOP_SAVED_ITEM_ID)
-    result = get_pipeline_data(pipeline_response, user_id)
-    return result.get("outputs").get("recipe_json")
+    key = run_journal.inputs_hash(GUMLOOP_SAVED_ITEM_ID, recipe_link)
+    if fresh:
+        _forget(key)
+    start = lambda: start_pipeline(recipe_link, user_id, GUMLOOP_SAVED_ITEM_ID)
+    wait = hedging.hedged_wait('recipe', start,
+                               lambda response, cancel: get_pipeline_data(response, user_id, cancel=cancel))
+    outputs = shared_cache.cache.get_or_compute(
+        'recipe', key, lambda: run_journal.run('recipe', key, user_id, start, wait).get("outputs"),
+        ttl=7 * 24 * 3600, validate=lambda outputs: bool(outputs.get("recipe_json")))
+    recipe_json = outputs.get("recipe_json")
+    if not recipe_json:
+        # Nothing usable came back; don't let the journal hand this run out again
+        run_journal.invalidate('recipe', key)
+    return recipe_json
     
 
 
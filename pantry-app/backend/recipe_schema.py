@@ -0,0 +1,345 @@
+"""
+Validation and local repair of recipe JSON coming back from the LLM pipelines.
+
+The recipe and suggestion pipelines are asked to follow recipe_format.json,
+but the model sometimes wraps its answer in code fences, leaves trailing
+commas, gets cut off mid-array, or returns numbers as strings. Re-running the
+pipeline for that is slow and expensive, so parse_recipe() fixes what it can
+locally:
+
+* text repair   - strips code fences / surrounding prose, trailing commas,
+                  and closes truncated strings, arrays and objects
+* schema check  - recipe_format.json is compiled once at import into plain
+                  Python validator functions that check and coerce each field
+                  (integer minutes and servings, string quantities, ...)
+* recipe fixups - ingredients without a name are dropped, a missing quantity
+                  becomes "", group defaults to "Main", and instructions are
+                  sorted by step_number and renumbered 1..n
+
+Only a recipe that is missing its title, ingredients or instructions after all
+that raises RecipeValidationError.
+"""
+
+import json
+import os
+import re
+
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'recipe_format.json')
+
+# A whole string literal (group 1 is the closing quote, None if cut off) or a structural character
+_STRUCTURE = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*(")?|[{}\[\],]')
+_TRAILING_COMMA = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"|(,)(\s*[}\]])')
+_MAYBE_TRAILING_COMMA = re.compile(r',\s*[}\]]')
+_LEADING_NUMBER = re.compile(r'-?\d+(?:\.\d+)?')
+_PLAIN_NUMBER = re.compile(r'\s*\d+(?:\.\d+)?\s*')
+_DURATION_PART = re.compile(r'(\d+(?:\.\d+)?)\s*(hours?|hrs?|h|minutes?|mins?|m)(?![a-z])')
+_LONG_DURATION = re.compile(r'day|week|night')
+# How many earlier elements we're willing to drop from a truncated document
+_MAX_CUTS = 50
+
+
+class RecipeValidationError(ValueError):
+    pass
+
+
+# ============================================================
+# TEXT REPAIR
+# ============================================================
+
+def _strip_wrapping(text):
+    text = text.strip()
+    if text.startswith('```'):
+        text = text.split('\n', 1)[1] if '\n' in text else text[3:]
+    if text.endswith('```'):
+        text = text[:-3]
+    text = text.strip()
+    start = text.find('{')
+    if start > 0:
+        text = text[start:]
+    end = text.rfind('}')
+    # Drop trailing prose after the object, but only if the object looks closed
+    if end != -1 and text.count('{') <= text.count('}'):
+        text = text[:end + 1]
+    return text
+
+
+def _remove_trailing_commas(text):
+    if not _MAYBE_TRAILING_COMMA.search(text):
+        return text
+    # Strings are matched whole so commas inside them are left alone
+    return _TRAILING_COMMA.sub(lambda m: m.group(2) if m.group(1) else m.group(0), text)
+
+
+def _close_truncated(text):
+    """
+    Close a JSON document that was cut off. Returns candidate texts, best first:
+    closing everything where it stopped, then cutting back to each earlier comma
+    (dropping the incomplete last element) and closing from there.
+    """
+    closers = ''   # closing brackets for everything currently open, innermost first
+    cuts = []
+    in_string = False
+    for match in _STRUCTURE.finditer(text):
+        token = match.group(0)
+        if token[0] == '"':
+            in_string = match.group(1) is None
+        elif token == '{':
+            closers = '}' + closers
+        elif token == '[':
+            closers = ']' + closers
+        elif token in '}]':
+            closers = closers[1:]
+        else:
+            cuts.append((match.start(), closers))
+
+    if not closers and not in_string:
+        return []
+    if in_string:
+        candidates = [text + '"' + closers]
+    else:
+        # Cut off right after a comma: drop it so we don't create a trailing comma
+        candidates = [text.rstrip().rstrip(',') + closers]
+    for index, cut_closers in reversed(cuts[-_MAX_CUTS:]):
+        candidates.append(text[:index] + cut_closers)
+    return candidates
+
+
+def repair_json(raw):
+    """Parse possibly-malformed JSON text. Returns (value, list of repairs applied)."""
+    try:
+        return json.loads(raw), []
+    except (json.JSONDecodeError, TypeError):
+        pass
+
+    repairs = []
+    text = _strip_wrapping(raw)
+    if text != raw.strip():
+        repairs.append('stripped code fences/surrounding text')
+    fixed = _remove_trailing_commas(text)
+    if fixed != text:
+        repairs.append('removed trailing commas')
+        text = fixed
+    try:
+        return json.loads(text), repairs
+    except json.JSONDecodeError:
+        pass
+
+    for candidate in _close_truncated(text):
+        try:
+            value = json.loads(candidate)
+        except json.JSONDecodeError:
+            continue
+        repairs.append('closed truncated JSON')
+        return value, repairs
+    raise RecipeValidationError('Recipe output is not valid JSON')
+
+
+# ============================================================
+# COMPILED SCHEMA
+# ============================================================
+
+def _coerce_integer(value, path, repairs):
+    if isinstance(value, bool):
+        raise RecipeValidationError(f'{path}: expected integer')
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float):
+        repairs.append(f'{path}: rounded to integer')
+        return int(round(value))
+    if isinstance(value, str):
+        match = _LEADING_NUMBER.search(value)
+        if match:
+            repairs.append(f'{path}: parsed integer from string')
+            return int(round(float(match.group())))
+    raise RecipeValidationError(f'{path}: expected integer')
+
+
+def _coerce_minutes(value, path, repairs):
+    """Like _coerce_integer, but '1 hour 30 minutes' / '1.5 hours' become 90, not 1 or 2."""
+    if not isinstance(value, str):
+        return _coerce_integer(value, path, repairs)
+    if _PLAIN_NUMBER.fullmatch(value):
+        repairs.append(f'{path}: parsed integer from string')
+        return int(round(float(value)))
+    text = value.lower()
+    parts = _DURATION_PART.findall(text)
+    if not parts or _LONG_DURATION.search(text):
+        # '2 days', 'overnight', ...: dropping the field beats guessing the wrong number
+        raise RecipeValidationError(f'{path}: unrecognized duration')
+    minutes = sum(float(amount) * (1 if unit.startswith('m') else 60) for amount, unit in parts)
+    repairs.append(f'{path}: parsed duration from string')
+    return int(round(minutes))
+
+
+def _coerce_number(value, path, repairs):
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value
+    if isinstance(value, str):
+        match = _LEADING_NUMBER.search(value)
+        if match:
+            repairs.append(f'{path}: parsed number from string')
+            return float(match.group())
+    raise RecipeValidationError(f'{path}: expected number')
+
+
+def _coerce_string(value, path, repairs):
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        repairs.append(f'{path}: converted number to string')
+        return f'{value:g}' if isinstance(value, float) else str(value)
+    raise RecipeValidationError(f'{path}: expected string')
+
+
+def _coerce_boolean(value, path, repairs):
+    if isinstance(value, bool):
+        return value
+    raise RecipeValidationError(f'{path}: expected boolean')
+
+
+_SCALARS = {
+    'integer': _coerce_integer,
+    'number': _coerce_number,
+    'string': _coerce_string,
+    'boolean': _coerce_boolean,
+}
+
+
+def compile_schema(schema):
+    """Turn a JSON Schema node into a function (value, path, repairs) -> coerced value."""
+    kind = schema.get('type')
+
+    if kind == 'object':
+        fields = [(name, _coerce_minutes if name.endswith('_minutes') and sub.get('type') == 'integer'
+                   else compile_schema(sub))
+                  for name, sub in schema.get('properties', {}).items()]
+        required = tuple(schema.get('required', ()))
+
+        def check_object(value, path, repairs):
+            if not isinstance(value, dict):
+                raise RecipeValidationError(f'{path}: expected object')
+            for name in required:
+                if name not in value or value[name] is None:
+                    raise RecipeValidationError(f'{path}.{name}: required')
+            out = dict(value)
+            for name, check in fields:
+                field = value.get(name)
+                if field is None:
+                    out.pop(name, None)
+                    continue
+                try:
+                    out[name] = check(field, f'{path}.{name}', repairs)
+                except RecipeValidationError:
+                    if name in required:
+                        raise
+                    # Optional field we can't make sense of: drop it rather than fail the recipe
+                    repairs.append(f'{path}.{name}: dropped invalid value')
+                    del out[name]
+            return out
+        return check_object
+
+    if kind == 'array':
+        check_item = compile_schema(schema.get('items', {}))
+
+        def check_array(value, path, repairs):
+            if isinstance(value, dict):
+                repairs.append(f'{path}: wrapped single object in list')
+                value = [value]
+            if not isinstance(value, list):
+                raise RecipeValidationError(f'{path}: expected array')
+            out = []
+            for i, item in enumerate(value):
+                try:
+                    out.append(check_item(item, f'{path}[{i}]', repairs))
+                except RecipeValidationError as e:
+                    repairs.append(f'dropped invalid item ({e})')
+            return out
+        return check_array
+
+    if kind in _SCALARS:
+        return _SCALARS[kind]
+
+    return lambda value, path, repairs: value
+
+
+def _load_recipe_schema():
+    with open(SCHEMA_PATH) as f:
+        schema = json.load(f)['parameters']
+    # quantity and step_number are required by the model's contract, but we can fill
+    # them in locally (validate_recipe), so don't throw the item away over them
+    for field, filled in (('ingredients', 'quantity'), ('instructions', 'step_number')):
+        items = schema['properties'][field]['items']
+        items['required'] = [name for name in items.get('required', []) if name != filled]
+    return compile_schema(schema)
+
+
+_validate_recipe = _load_recipe_schema()
+
+
+# ============================================================
+# PUBLIC API
+# ============================================================
+
+def validate_recipe(recipe):
+    """Check and coerce an already-parsed recipe dict. Returns (recipe, repairs)."""
+    repairs = []
+    recipe = _validate_recipe(recipe, 'recipe', repairs)
+
+    for ingredient in recipe['ingredients']:
+        if not str(ingredient.get('name', '')).strip():
+            continue
+        if 'quantity' not in ingredient:
+            ingredient['quantity'] = ''
+            repairs.append(f"ingredient {ingredient['name']!r}: missing quantity")
+        ingredient.setdefault('group', 'Main')
+    recipe['ingredients'] = [i for i in recipe['ingredients'] if str(i.get('name', '')).strip()]
+
+    steps = recipe['instructions']
+    numbers = [step.get('step_number') for step in steps]
+    if numbers != list(range(1, len(steps) + 1)):
+        # Steps without a number keep their position relative to the list order
+        order = {id(step): i for i, step in enumerate(steps)}
+        steps.sort(key=lambda step: (step.get('step_number', order[id(step)] + 1), order[id(step)]))
+        for number, step in enumerate(steps, start=1):
+            step['step_number'] = number
+        repairs.append('renumbered instructions')
+
+    if not recipe['ingredients'] or not steps:
+        raise RecipeValidationError('Recipe has no usable ingredients or instructions')
+    return recipe, repairs
+
+
+def parse_recipe(raw):
+    """Parse, repair and validate raw pipeline output (str or dict). Returns (recipe, repairs)."""
+    if isinstance(raw, dict):
+        value, repairs = raw, []
+    else:
+        value, repairs = repair_json(raw)
+    recipe, schema_repairs = validate_recipe(value)
+    return recipe, repairs + schema_repairs
+
+
+if __name__ == "__main__":
+    import time
+
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'recipe_example.json')) as f:
+        example = f.read()
+
+    broken = {
+        'clean': example,
+        'code fence': "```json\n" + example + "\n```",
+        'trailing commas': example.replace('"group": "Main"\n    }', '"group": "Main",\n    }'),
+        'truncated': example[:int(len(example) * 0.8)],
+        'string numbers': example.replace('"servings": 6', '"servings": "6 people"'),
+    }
+    for label, text in broken.items():
+        recipe, repairs = parse_recipe(text)
+        print(f"{label:16s} {len(recipe['ingredients'])} ingredients, {len(recipe['instructions'])} steps, repairs: {repairs}")
+
+    for label in ('clean', 'truncated'):
+        count = 2000
+        start = time.perf_counter()
+        for _ in range(count):
+            parse_recipe(broken[label])
+        elapsed = time.perf_counter() - start
+        print(f"{label}: {count / elapsed:,.0f} recipes/s")
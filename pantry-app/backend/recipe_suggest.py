@@ -4,6 +4,12 @@ import os
 import base64
 import time
 from PIL import Image  
+from circuit_breaker import gumloop_breaker
+import pipeline_callbacks
+import pipeline_polling
+import run_journal
+import shared_cache
+import recipe_schema
 
 
 load_dotenv(override=True)
@@ -29,7 +35,7 @@ def start_pipeline(pantry_csv, user_id, saved_item_id):
                 "input_name": "pantry",
                 "value": f"{pantry_csv}"
             }
-        ]
+        ] + pipeline_callbacks.pipeline_inputs()
     }
     
     headers = {
@@ -40,7 +46,7 @@ def start_pipeline(pantry_csv, user_id, saved_item_id):
     # Make the request
     print(f"Starting pipeline to suggest recipes")
     try:
-        response = requests.post(url, json=payload, headers=headers, timeout=30)
+        response = gumloop_breaker.request('POST', url, json=payload, headers=headers, timeout=30)
         response.raise_for_status()
     except requests.exceptions.Timeout:
         raise Exception("Pipeline start request timed out")
@@ -52,52 +58,45 @@ def start_pipeline(pantry_csv, user_id, saved_item_id):
     except ValueError as e:
         raise Exception(f"Invalid JSON response from pipeline start: {str(e)}")
 
-def get_pipeline_data(response, user_id, max_wait_time=300):
-    run_id = response.get("run_id")
-    if not run_id:
-        raise ValueError("No run_id found in pipeline response")
-    
-    url = f"https://api.gumloop.com/api/v1/get_pl_run?run_id={run_id}&user_id={user_id}"
+def get_pipeline_data(response, user_id, max_wait_time=300, cancel=None):
+    return pipeline_polling.wait_for_run(response, user_id, gumloop_api_key, max_wait_time, cancel)
 
-    headers = {
-        "Authorization": f"Bearer {gumloop_api_key}",
-    }
-
-    start_time = time.time()
-    while True:
-        # Check timeout
-        if time.time() - start_time > max_wait_time:
-            raise TimeoutError(f"Pipeline did not complete within {max_wait_time} seconds")
-        
+def has_usable_recipe(outputs):
+    """True if at least one of output1..output3 passes recipe_schema.parse_recipe."""
+    for i in range(1, 4):
+        recipe_str = outputs.get(f'output{i}')
+        if not recipe_str:
+            continue
         try:
-            response = requests.get(url, headers=headers, timeout=30)
-            response.raise_for_status()
-        except requests.exceptions.RequestException as e:
-            raise Exception(f"Error checking pipeline status: {str(e)}")
-        
-        try:
-            data = response.json()
-        except ValueError as e:
-            raise Exception(f"Invalid JSON response from pipeline status: {str(e)}")
-        
-        state = data.get("state")
-        if state == "DONE":
-            break
-        elif state == "FAILED" or state == "ERROR":
-            error_msg = data.get("error", "Unknown error")
-            raise Exception(f"Pipeline failed with state {state}: {error_msg}")
-        
-        time.sleep(2)
-    
-    return data
+            recipe_schema.parse_recipe(recipe_str)
+        except recipe_schema.RecipeValidationError:
+            continue
+        return True
+    return False
 
 
 def run_pipeline(pantry_csv, user_id):
+    """Returns {'outputs': ..., 'computed_at': epoch seconds the run finished}, or None."""
     # Upload image and start pipeline
     GUMLOOP_SAVED_ITEM_ID = "6rJM8cctyz3xjYTooAMjpe"
-    pipeline_response = start_pipeline(pantry_csv, user_id, GUMLOOP_SAVED_ITEM_ID)
-    result = get_pipeline_data(pipeline_response, user_id)
-    return result.get("outputs")
+    key = run_journal.inputs_hash(GUMLOOP_SAVED_ITEM_ID, pantry_csv)
+    start = lambda: start_pipeline(pantry_csv, user_id, GUMLOOP_SAVED_ITEM_ID)
+    wait = lambda response: get_pipeline_data(response, user_id)
+
+    def compute():
+        data = run_journal.run('suggest', key, user_id, start, wait)
+        if not data.get("outputs"):
+            return None
+        # Keep the finish time with the outputs so cache hits report their real age
+        return {'outputs': data["outputs"], 'computed_at': data.get("finished_at") or time.time()}
+
+    # Suggestions should stay fresh-ish, so they expire sooner than receipts and recipes
+    result = shared_cache.cache.get_or_compute(
+        'suggest', key, compute, ttl=3600, validate=lambda result: has_usable_recipe(result['outputs']))
+    if result is None or not has_usable_recipe(result['outputs']):
+        # Nothing usable came back; don't let the journal hand this run out again
+        run_journal.invalidate('suggest', key)
+    return result
     
 
 
@@ -0,0 +1,223 @@
+"""
+Durable journal of Gumloop pipeline runs.
+
+Every run we start is written to a small SQLite file together with a hash of
+its inputs. That gives us two things:
+
+* If the backend restarts mid-run, resume_outstanding() picks the RUNNING rows
+  back up and keeps polling them, so the run_id (and the money spent on it)
+  isn't lost.
+* A duplicate submission (client retry, double click, same receipt uploaded
+  again) attaches to the existing run instead of starting a new one. Finished
+  runs are reused for RUN_JOURNAL_REUSE_SECONDS.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from admission import Overloaded
+
+JOURNAL_PATH = os.getenv('RUN_JOURNAL_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'run_journal.db'))
+REUSE_SECONDS = float(os.getenv('RUN_JOURNAL_REUSE_SECONDS', '3600'))
+# A RUNNING row older than this is treated as abandoned rather than attached to.
+# Matches get_pipeline_data's 300 s max_wait_time plus some slack.
+MAX_RUN_AGE = float(os.getenv('RUN_JOURNAL_MAX_RUN_AGE', '330'))
+
+RUNNING = 'RUNNING'
+DONE = 'DONE'
+FAILED = 'FAILED'
+ABANDONED = 'ABANDONED'
+
+# Striped locks so concurrent identical submissions in this process start only one run
+_key_locks = [threading.Lock() for _ in range(64)]
+_local = threading.local()
+
+
+def _connect():
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(JOURNAL_PATH, timeout=10)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS runs (
+                run_id TEXT PRIMARY KEY,
+                pipeline TEXT NOT NULL,
+                inputs_hash TEXT NOT NULL,
+                user_id TEXT NOT NULL,
+                state TEXT NOT NULL,
+                outputs TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS runs_by_inputs ON runs (pipeline, inputs_hash, created_at)")
+        conn.commit()
+        _local.conn = conn
+    return conn
+
+
+def inputs_hash(*parts):
+    """Stable hash of a run's inputs (str or bytes parts)."""
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode('utf-8')
+        digest.update(hashlib.sha256(part).digest())
+    return digest.hexdigest()
+
+
+def find_reusable(pipeline, key):
+    """Latest run with these inputs that we can attach to, or None."""
+    now = time.time()
+    conn = _connect()
+    row = conn.execute(
+        "SELECT * FROM runs WHERE pipeline = ? AND inputs_hash = ? AND state IN (?, ?) "
+        "ORDER BY created_at DESC LIMIT 1",
+        (pipeline, key, RUNNING, DONE),
+    ).fetchone()
+    if row is None:
+        return None
+    if row['state'] == RUNNING and now - row['created_at'] > MAX_RUN_AGE:
+        _set_state(row['run_id'], ABANDONED)
+        return None
+    if row['state'] == DONE and now - row['updated_at'] > REUSE_SECONDS:
+        return None
+    return row
+
+
+def record_start(pipeline, key, user_id, run_id):
+    now = time.time()
+    conn = _connect()
+    conn.execute(
+        "INSERT OR REPLACE INTO runs (run_id, pipeline, inputs_hash, user_id, state, created_at, updated_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (run_id, pipeline, key, user_id, RUNNING, now, now),
+    )
+    conn.commit()
+
+
+def record_done(run_id, outputs):
+    _set_state(run_id, DONE, outputs=json.dumps(outputs))
+
+
+def record_failed(run_id, error):
+    _set_state(run_id, FAILED, error=str(error))
+
+
+def invalidate(pipeline, key):
+    """Stop reusing finished runs with these inputs (bad outputs, or a fresh run was asked for)."""
+    conn = _connect()
+    conn.execute(
+        "UPDATE runs SET state = ?, updated_at = ? WHERE pipeline = ? AND inputs_hash = ? AND state = ?",
+        (ABANDONED, time.time(), pipeline, key, DONE),
+    )
+    conn.commit()
+
+
+def outstanding():
+    conn = _connect()
+    cutoff = time.time() - MAX_RUN_AGE
+    return conn.execute(
+        "SELECT * FROM runs WHERE state = ? AND created_at >= ?", (RUNNING, cutoff)
+    ).fetchall()
+
+
+def _set_state(run_id, state, outputs=None, error=None):
+    conn = _connect()
+    conn.execute(
+        "UPDATE runs SET state = ?, outputs = COALESCE(?, outputs), error = ?, updated_at = ? WHERE run_id = ?",
+        (state, outputs, error, time.time(), run_id),
+    )
+    conn.commit()
+
+
+def _key_lock(pipeline, key):
+    return _key_locks[hash((pipeline, key)) % len(_key_locks)]
+
+
+def _wait_and_record(run_id, response, wait):
+    try:
+        data = wait(response)
+    except TimeoutError:
+        # Waited the full polling budget: the run is stuck upstream. Don't let retries attach
+        # to it (and time out again); the next submission starts a fresh run
+        _set_state(run_id, ABANDONED, error='timed out waiting for run')
+        raise
+    except Overloaded:
+        # Circuit opened mid-wait; the run may still finish, so leave it RUNNING to attach to later
+        raise
+    except Exception as e:
+        record_failed(run_id, e)
+        raise
+    record_done(run_id, data.get("outputs"))
+    return data
+
+
+def run(pipeline, key, user_id, start, wait):
+    """
+    Start a pipeline run through the journal, or attach to an existing one.
+    start() -> start_pipeline response with a run_id; wait(response) -> get_pipeline_data result.
+    """
+    with _key_lock(pipeline, key):
+        row = find_reusable(pipeline, key)
+        if row is not None and row['state'] == DONE:
+            print(f"Reusing finished {pipeline} run {row['run_id']}")
+            return {"run_id": row['run_id'], "state": DONE, "outputs": json.loads(row['outputs'] or 'null'),
+                    "finished_at": row['updated_at']}
+        if row is not None:
+            print(f"Attaching to running {pipeline} run {row['run_id']}")
+            response = {"run_id": row['run_id']}
+        else:
+            response = start()
+            run_id = response.get("run_id")
+            if run_id:
+                record_start(pipeline, key, user_id, run_id)
+
+    run_id = response.get("run_id")
+    if not run_id:
+        # Let get_pipeline_data raise its usual "No run_id" error
+        return wait(response)
+    return _wait_and_record(run_id, response, wait)
+
+
+def _claim(row):
+    """Take over a RUNNING row; with several workers starting at once only one wins each run."""
+    conn = _connect()
+    cursor = conn.execute(
+        "UPDATE runs SET updated_at = ? WHERE run_id = ? AND state = ? AND updated_at = ?",
+        (time.time(), row['run_id'], RUNNING, row['updated_at']),
+    )
+    conn.commit()
+    return cursor.rowcount == 1
+
+
+def resume_outstanding(waiters):
+    """
+    Resume polling runs left RUNNING by a previous process.
+    waiters maps pipeline name -> get_pipeline_data(response, user_id).
+    Returns how many runs this process took over.
+    """
+    resumed = 0
+    for row in outstanding():
+        wait = waiters.get(row['pipeline'])
+        if wait is None or not _claim(row):
+            continue
+        resumed += 1
+        response = {"run_id": row['run_id']}
+        user_id = row['user_id']
+
+        def resume(run_id=row['run_id'], response=response, wait=wait, user_id=user_id):
+            try:
+                _wait_and_record(run_id, response, lambda r: wait(r, user_id))
+                print(f"Resumed run {run_id} finished")
+            except Exception as e:
+                print(f"Resumed run {run_id} did not finish: {e}")
+
+        threading.Thread(target=resume, daemon=True).start()
+    return resumed
@@ -0,0 +1,263 @@
+"""
+Cross-worker cache tier for pipeline results.
+
+An in-process cache dies with the process and isn't shared when the backend
+runs several workers, so each worker would repeat the same Gumloop runs. This
+module keeps pipeline outputs in a store every worker can see:
+
+* SQLiteCache (default) - a local file (SHARED_CACHE_PATH) shared by all
+  workers on the host, with TTLs and LRU eviction once SHARED_CACHE_MAX_BYTES
+  is exceeded.
+* RedisCache - used when SHARED_CACHE_URL=redis://... is set and the `redis`
+  package is installed; any Redis-compatible server works, including a local
+  one. Size is bounded by the server's maxmemory policy (use allkeys-lru).
+
+get_or_compute() adds stampede protection: the first worker to miss takes a
+short lease and runs the pipeline, others wait for its result instead of
+starting identical runs. Hit/miss counters are kept per namespace.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pipeline_cache.db')
+CACHE_PATH = os.getenv('SHARED_CACHE_PATH', DEFAULT_PATH)
+CACHE_URL = os.getenv('SHARED_CACHE_URL')
+MAX_BYTES = int(os.getenv('SHARED_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+# Long enough to cover a full pipeline run (get_pipeline_data waits up to 300 s)
+LEASE_SECONDS = 330
+WAIT_POLL_SECONDS = 0.5
+
+
+class SQLiteCache:
+    def __init__(self, path=CACHE_PATH, max_bytes=MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._sets_since_evict = 0
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    expires_at REAL NOT NULL,
+                    last_access REAL NOT NULL,
+                    PRIMARY KEY (namespace, key)
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_by_access ON entries (last_access)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS leases (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    PRIMARY KEY (namespace, key)
+                )
+            """)
+            self._local.conn = conn
+        return conn
+
+    def get(self, namespace, key):
+        now = time.time()
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT value, expires_at FROM entries WHERE namespace = ? AND key = ?", (namespace, key)
+        ).fetchone()
+        if row is None or row[1] < now:
+            return False, None
+        conn.execute(
+            "UPDATE entries SET last_access = ? WHERE namespace = ? AND key = ?", (now, namespace, key)
+        )
+        return True, json.loads(row[0])
+
+    def set(self, namespace, key, value, ttl):
+        now = time.time()
+        text = json.dumps(value)
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO entries (namespace, key, value, size, expires_at, last_access) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (namespace, key, text, len(text), now + ttl, now),
+        )
+        self._sets_since_evict += 1
+        if self._sets_since_evict >= 20:
+            self._sets_since_evict = 0
+            self.evict()
+
+    def delete(self, namespace, key):
+        self._connect().execute("DELETE FROM entries WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def evict(self):
+        """Drop expired entries, then least recently used ones until under max_bytes."""
+        conn = self._connect()
+        conn.execute("DELETE FROM entries WHERE expires_at < ?", (time.time(),))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        freed = 0
+        victims = []
+        for namespace, key, size in conn.execute(
+            "SELECT namespace, key, size FROM entries ORDER BY last_access"
+        ):
+            victims.append((namespace, key))
+            freed += size
+            if freed >= excess:
+                break
+        conn.executemany("DELETE FROM entries WHERE namespace = ? AND key = ?", victims)
+
+    def try_lock(self, namespace, key, lease):
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT expires_at FROM leases WHERE namespace = ? AND key = ?", (namespace, key)
+            ).fetchone()
+            if row is not None and row[0] > now:
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO leases (namespace, key, expires_at) VALUES (?, ?, ?)",
+                (namespace, key, now + lease),
+            )
+            return True
+        finally:
+            conn.execute("COMMIT")
+
+    def unlock(self, namespace, key):
+        self._connect().execute("DELETE FROM leases WHERE namespace = ? AND key = ?", (namespace, key))
+
+
+class RedisCache:
+    def __init__(self, url, prefix='pantrypal'):
+        try:
+            import redis
+        except ImportError:
+            raise ImportError("SHARED_CACHE_URL is set but the 'redis' package is not installed. Run: pip install redis")
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+
+    def _key(self, namespace, key):
+        return f"{self.prefix}:{namespace}:{key}"
+
+    def get(self, namespace, key):
+        value = self._client.get(self._key(namespace, key))
+        if value is None:
+            return False, None
+        return True, json.loads(value)
+
+    def set(self, namespace, key, value, ttl):
+        self._client.set(self._key(namespace, key), json.dumps(value), ex=max(1, int(ttl)))
+
+    def delete(self, namespace, key):
+        self._client.delete(self._key(namespace, key))
+
+    def try_lock(self, namespace, key, lease):
+        return bool(self._client.set(self._key(namespace, key) + ':lease', '1', nx=True, ex=int(lease)))
+
+    def unlock(self, namespace, key):
+        self._client.delete(self._key(namespace, key) + ':lease')
+
+
+class SharedCache:
+    def __init__(self, backend):
+        self.backend = backend
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def _count(self, namespace, field):
+        with self._lock:
+            counters = self._stats.setdefault(namespace, {'hits': 0, 'misses': 0, 'coalesced': 0, 'errors': 0})
+            counters[field] += 1
+
+    def get(self, namespace, key):
+        try:
+            found, value = self.backend.get(namespace, key)
+        except Exception as e:
+            # A broken cache must never take the endpoint down with it
+            print(f"Shared cache read failed: {e}")
+            self._count(namespace, 'errors')
+            return False, None
+        self._count(namespace, 'hits' if found else 'misses')
+        return found, value
+
+    def set(self, namespace, key, value, ttl):
+        try:
+            self.backend.set(namespace, key, value, ttl)
+        except Exception as e:
+            print(f"Shared cache write failed: {e}")
+            self._count(namespace, 'errors')
+
+    def delete(self, namespace, key):
+        try:
+            self.backend.delete(namespace, key)
+        except Exception as e:
+            print(f"Shared cache delete failed: {e}")
+            self._count(namespace, 'errors')
+
+    def get_or_compute(self, namespace, key, compute, ttl, validate=None):
+        """
+        Return the cached value, or compute it once across all workers.
+        None results, and results validate(value) rejects, are not cached.
+        """
+        found, value = self.get(namespace, key)
+        if found:
+            return value
+
+        deadline = time.time() + LEASE_SECONDS
+        while True:
+            try:
+                locked = self.backend.try_lock(namespace, key, LEASE_SECONDS)
+            except Exception as e:
+                print(f"Shared cache lease failed: {e}")
+                locked = None
+            if locked or locked is None or time.time() > deadline:
+                break
+            # Another worker is already computing this; wait for its result
+            time.sleep(WAIT_POLL_SECONDS)
+            try:
+                found, value = self.backend.get(namespace, key)
+            except Exception:
+                found = False
+            if found:
+                self._count(namespace, 'coalesced')
+                return value
+
+        try:
+            value = compute()
+            if value is not None and (validate is None or validate(value)):
+                self.set(namespace, key, value, ttl)
+            return value
+        finally:
+            if locked:
+                try:
+                    self.backend.unlock(namespace, key)
+                except Exception as e:
+                    print(f"Shared cache unlock failed: {e}")
+
+    def stats(self):
+        with self._lock:
+            namespaces = {}
+            for namespace, counters in self._stats.items():
+                lookups = counters['hits'] + counters['misses']
+                namespaces[namespace] = dict(counters, hit_ratio=round(counters['hits'] / lookups, 3) if lookups else None)
+        return {'backend': type(self.backend).__name__, 'namespaces': namespaces}
+
+
+def _default_backend():
+    if CACHE_URL:
+        return RedisCache(CACHE_URL)
+    return SQLiteCache()
+
+
+cache = SharedCache(_default_backend())
@@ -0,0 +1,163 @@
+"""
+Speculative suggestion runs on pantry change.
+
+Users usually open Suggestions right after scanning a receipt or cooking, and
+then sit through a full suggestion pipeline run. The frontend reports every
+pantry change to /api/pantry/changed; we wait SUGGEST_PRECOMPUTE_DEBOUNCE
+seconds for the edits to settle (each new change for the same user restarts the
+timer and replaces the pending pantry), then run the pipeline in the
+background and store the outputs under a fingerprint of the pantry.
+/api/recipes/suggestions looks up the same fingerprint first and answers
+straight away on a match.
+
+Each user gets at most SUGGEST_PRECOMPUTE_BUDGET background runs per
+SUGGEST_PRECOMPUTE_WINDOW seconds, so a busy pantry session can't burn through
+pipeline credits. Results live in the shared cache tier, so any worker can
+serve them.
+"""
+
+import csv
+import hashlib
+import io
+import os
+import threading
+import time
+from collections import deque
+
+import shared_cache
+
+DEBOUNCE = float(os.getenv('SUGGEST_PRECOMPUTE_DEBOUNCE', '5'))
+BUDGET = int(os.getenv('SUGGEST_PRECOMPUTE_BUDGET', '10'))
+WINDOW = float(os.getenv('SUGGEST_PRECOMPUTE_WINDOW', '3600'))
+# Same lifetime as the suggestion pipeline's own cache entries
+TTL = int(os.getenv('SUGGEST_PRECOMPUTE_TTL', '3600'))
+NAMESPACE = 'suggest_precomputed'
+
+
+def canonical_csv(pantry_csv):
+    """
+    Pantry CSV with whitespace trimmed and item rows sorted, so the same pantry
+    listed in a different order gives the same text (and the same pipeline cache key).
+    """
+    rows = list(csv.reader(io.StringIO(pantry_csv.strip())))
+    rows = [[cell.strip() for cell in row] for row in rows if any(cell.strip() for cell in row)]
+    if not rows:
+        return ''
+    header, items = rows[0], sorted(rows[1:])
+    out = io.StringIO()
+    csv.writer(out, lineterminator='\n').writerows([header] + items)
+    return out.getvalue().strip()
+
+
+def fingerprint(pantry_csv):
+    return hashlib.sha1(canonical_csv(pantry_csv).encode('utf-8')).hexdigest()
+
+
+class SuggestionPrecomputer:
+    def __init__(self, run, debounce=DEBOUNCE, budget=BUDGET, window=WINDOW, ttl=TTL, cache=None):
+        """run(pantry_csv) runs the suggestion pipeline and returns {'outputs', 'computed_at'} (or None)."""
+        self.run = run
+        self.debounce = debounce
+        self.budget = budget
+        self.window = window
+        self.ttl = ttl
+        self.cache = cache or shared_cache.cache
+        self._lock = threading.Lock()
+        self._pending = {}    # user -> (canonical csv, fingerprint) waiting for its timer
+        self._timers = {}     # user -> threading.Timer
+        self._running = set()
+        self._history = {}    # user -> deque of background run start times
+        self._stats = {'scheduled': 0, 'coalesced': 0, 'runs': 0, 'failed': 0,
+                       'already_fresh': 0, 'over_budget': 0, 'served': 0}
+
+    def schedule(self, user_key, pantry_csv):
+        """Note a pantry change; a background run starts once changes stop for `debounce` seconds."""
+        text = canonical_csv(pantry_csv)
+        fp = hashlib.sha1(text.encode('utf-8')).hexdigest()
+        with self._lock:
+            self._stats['scheduled'] += 1
+            if user_key in self._pending:
+                self._stats['coalesced'] += 1
+            self._pending[user_key] = (text, fp)
+            self._arm(user_key, self.debounce)
+        return fp
+
+    def _arm(self, user_key, delay):
+        # Caller holds self._lock
+        timer = self._timers.get(user_key)
+        if timer is not None:
+            timer.cancel()
+        timer = threading.Timer(delay, self._fire, args=(user_key,))
+        timer.daemon = True
+        self._timers[user_key] = timer
+        timer.start()
+
+    def _fire(self, user_key):
+        with self._lock:
+            if self._timers.get(user_key) is not threading.current_thread():
+                return  # superseded by a later change
+            if user_key in self._running:
+                # Still busy with an older pantry; try again once that's had time to finish
+                self._arm(user_key, self.debounce)
+                return
+            del self._timers[user_key]
+            text, fp = self._pending.pop(user_key)
+
+            if self._lookup_raw(fp) is not None:
+                self._stats['already_fresh'] += 1
+                return
+            now = time.time()
+            history = self._history.setdefault(user_key, deque())
+            while history and history[0] < now - self.window:
+                history.popleft()
+            if len(history) >= self.budget:
+                self._stats['over_budget'] += 1
+                print(f"Suggestion precompute skipped for {user_key}: budget of {self.budget} runs used")
+                return
+            history.append(now)
+            self._running.add(user_key)
+            self._stats['runs'] += 1
+
+        try:
+            result = self.run(text)
+            if result:
+                self.store(fp, result['outputs'], result['computed_at'])
+        except Exception as e:
+            # Speculative work: the user can still ask for suggestions the normal way
+            with self._lock:
+                self._stats['failed'] += 1
+            print(f"Suggestion precompute failed for {user_key}: {e}")
+        finally:
+            with self._lock:
+                self._running.discard(user_key)
+
+    def _lookup_raw(self, fp):
+        try:
+            found, value = self.cache.backend.get(NAMESPACE, fp)
+        except Exception:
+            return None
+        return value if found else None
+
+    def store(self, fp, outputs, computed_at=None):
+        """Keep outputs for this fingerprint until `ttl` seconds after they were computed."""
+        computed_at = computed_at or time.time()
+        ttl = self.ttl - (time.time() - computed_at)
+        if ttl > 0:
+            self.cache.set(NAMESPACE, fp, {'outputs': outputs, 'computed_at': computed_at}, ttl)
+
+    def discard(self, pantry_csv):
+        self.cache.delete(NAMESPACE, fingerprint(pantry_csv))
+
+    def lookup(self, pantry_csv):
+        """Stored {'outputs', 'computed_at'} for this pantry, or None."""
+        found, value = self.cache.get(NAMESPACE, fingerprint(pantry_csv))
+        if not found:
+            return None
+        with self._lock:
+            self._stats['served'] += 1
+        return value
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, pending=len(self._pending), running=len(self._running),
+                        debounce_seconds=self.debounce, budget=self.budget, window_seconds=self.window)
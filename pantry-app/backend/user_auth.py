@@ -0,0 +1,71 @@
+"""
+Server-side check of who is calling.
+
+The frontend sends the signed-in user's Firebase ID token as
+`Authorization: Bearer <token>`. verified_uid() checks the token's signature
+against Google's published Firebase signing certificates, plus its audience,
+issuer and expiry, and returns the uid inside it. Anything kept per user
+(duplicate receipts, queue fairness, precompute budgets) is keyed on that uid,
+never on an id the client states about itself.
+
+Needs `pip install google-auth`; no service account is required.
+FIREBASE_PROJECT_ID names the project whose tokens we accept (default: the one
+the frontend signs in to). Without the package, or with a missing, expired or
+forged token, the caller is anonymous.
+"""
+
+import os
+import re
+import threading
+import time
+
+import requests
+
+try:
+    from google.auth import jwt as google_jwt
+except ImportError:
+    google_jwt = None
+
+PROJECT_ID = os.getenv('FIREBASE_PROJECT_ID', 'mchacks-food-project')
+CERTS_URL = 'https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com'
+ISSUER = f'https://securetoken.google.com/{PROJECT_ID}'
+
+_certs = {}
+_certs_expire_at = 0.0
+_certs_lock = threading.Lock()
+
+if google_jwt is None:
+    print("google-auth not installed: every caller is treated as anonymous. Run: pip install google-auth")
+
+
+def _signing_certs():
+    """Google's current signing certificates, refetched when their Cache-Control max-age runs out."""
+    global _certs, _certs_expire_at
+    with _certs_lock:
+        if time.time() < _certs_expire_at:
+            return _certs
+        response = requests.get(CERTS_URL, timeout=10)
+        response.raise_for_status()
+        match = re.search(r'max-age=(\d+)', response.headers.get('Cache-Control', ''))
+        _certs = response.json()
+        _certs_expire_at = time.time() + (int(match.group(1)) if match else 3600)
+        return _certs
+
+
+def verified_uid(authorization):
+    """uid from an `Authorization: Bearer <Firebase ID token>` header value, or None."""
+    if google_jwt is None or not authorization:
+        return None
+    scheme, _, token = authorization.partition(' ')
+    if scheme.lower() != 'bearer' or not token.strip():
+        return None
+    try:
+        # Checks the RS256 signature, exp/iat and that the token was minted for our project
+        claims = google_jwt.decode(token.strip(), certs=_signing_certs(), audience=PROJECT_ID)
+    except Exception as e:
+        print(f"Rejected ID token: {e}")
+        return None
+    if claims.get('iss') != ISSUER or not claims.get('sub'):
+        print("Rejected ID token: wrong issuer or no subject")
+        return None
+    return claims['sub']
@@ -1,21 +1,32 @@
 // API service for connecting to Flask backend
+import { auth } from './firebase';
+
 const API_BASE_URL = '/api';
 
 // Helper function for API calls
 async function apiCall(endpoint, options = {}) {
   const url = `${API_BASE_URL}${endpoint}`;
+  const { headers = { 'Content-Type': 'application/json' }, ...rest } = options;
+  // The backend verifies this token and uses its uid for per-user queue fairness and duplicate-receipt detection
+  const token = await auth.currentUser?.getIdToken();
   const config = {
-    headers: {
-      'Content-Type': 'application/json',
-      ...options.headers,
-    },
-    ...options,
+    ...rest,
+    headers: token ? { ...headers, Authorization: `Bearer ${token}` } : headers,
   };
 
   try {
     const response = await fetch(url, config);
     if (!response.ok) {
-      throw new Error(`API Error: ${response.status}`);
+      // Pass the backend's reason through (422 rejected photo, 429/503 busy, ...)
+      const body = await response.json().catch(() => null);
+      let message = body?.error || `API Error: ${response.status}`;
+      if (body?.retry_after) {
+        message += ` Try again in ${body.retry_after}s.`;
+      }
+      const error = new Error(message);
+      error.status = response.status;
+      error.body = body;
+      throw error;
     }
     return await response.json();
   } catch (error) {
@@ -24,6 +35,24 @@ async function apiCall(endpoint, options = {}) {
   }
 }
 
+// Pantry items -> the CSV the suggestion pipeline expects (food_name,quantity,unit,food_category)
+export function pantryToSuggestionCSV(pantryItems) {
+  const categoryMap = {
+    protein: 'Proteins',
+    dairy: 'Dairy',
+    grain: 'Grains',
+    fruit: 'Fruits',
+    vegetable: 'Vegetables',
+    other: 'Other',
+  };
+  const csvHeader = 'food_name,quantity,unit,food_category';
+  const csvRows = pantryItems.map((item) => {
+    const category = categoryMap[item.category] || 'Other';
+    return `${item.name},${item.quantity},${item.unit || 'null'},${category}`;
+  });
+  return [csvHeader, ...csvRows].join('\n');
+}
+
 // Pantry API
 export const pantryApi = {
   // Get all pantry items
@@ -46,6 +75,12 @@ export const pantryApi = {
     method: 'DELETE',
   }),
   
+  // Tell the backend the pantry changed so it can precompute suggestions in the background
+  reportChange: (pantryCSV) => apiCall('/pantry/changed', {
+    method: 'POST',
+    body: JSON.stringify({ pantry_csv: pantryCSV }),
+  }),
+  
   // Upload receipt image for OCR
   uploadReceipt: (formData) => apiCall('/pantry/receipt', {
     method: 'POST',
@@ -12,6 +12,7 @@ import {
   Timestamp
 } from 'firebase/firestore'
 import { db } from './firebase'
+import { pantryApi, pantryToSuggestionCSV } from './api'
 
 // Pantry Firebase service for managing user's pantry items
 export const pantryFirebase = {
@@ -94,6 +95,19 @@ export const pantryFirebase = {
     }
   },
 
+  // Report the current pantry to the backend after an edit (receipt import, cooking, manual change).
+  // Fire and forget: suggestions still work the normal way if this fails.
+  reportChange: async (userId) => {
+    try {
+      const items = await pantryFirebase.getItems(userId)
+      if (items.length > 0) {
+        await pantryApi.reportChange(pantryToSuggestionCSV(items))
+      }
+    } catch (error) {
+      console.warn('Could not report pantry change:', error)
+    }
+  },
+
   // Export pantry to CSV format: food_name,quantity,unit,food_category
   exportToCSV: async (userId) => {
     try {
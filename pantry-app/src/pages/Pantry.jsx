@@ -62,6 +62,7 @@ export function Pantry() {
         expiryDate: newItem.expiryDate || null
       })
       setPantryItems(prev => [...prev, item])
+      pantryFirebase.reportChange(user.uid)
       setNewItem({
         name: '',
         quantity: '',
@@ -93,6 +94,7 @@ export function Pantry() {
       setPantryItems(prev => prev.map(item => 
         item.id === editingItem.id ? editingItem : item
       ))
+      pantryFirebase.reportChange(user.uid)
       setEditingItem(null)
       setIsEditDialogOpen(false)
       setError(null)
@@ -111,6 +113,7 @@ export function Pantry() {
     try {
       await pantryFirebase.deleteItem(user.uid, itemId)
       setPantryItems(prev => prev.filter(item => item.id !== itemId))
+      pantryFirebase.reportChange(user.uid)
     } catch (err) {
       setError(err.message)
     }
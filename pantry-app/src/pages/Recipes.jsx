@@ -227,6 +227,7 @@ export function Recipes() {
           }
         }
       }
+      pantryFirebase.reportChange(user.uid)
       
       setNotification({
         open: true,
@@ -117,7 +117,9 @@ export function SearchRecipes() {
     } catch (err) {
       console.error("Recipe import error:", err);
       setError(
-        "Failed to import recipe. Make sure the backend server is running on port 5001.",
+        err.status
+          ? err.message
+          : "Failed to import recipe. Make sure the backend server is running on port 5001.",
       );
     } finally {
       setIsProcessing(false);
@@ -39,7 +39,7 @@ import {
 import { useAuth } from "@/contexts/AuthContext";
 import { pantryFirebase } from "@/lib/pantryFirebase";
 import { recipesFirebase } from "@/lib/recipesFirebase";
-import { recipeApi } from "@/lib/api";
+import { recipeApi, pantryToSuggestionCSV } from "@/lib/api";
 import { mockRecipes } from "@/lib/mockData";
 
 export function Suggestions() {
@@ -280,20 +280,7 @@ export function Suggestions() {
 
     try {
       // Convert pantry items to CSV format
-      const csvHeader = "food_name,quantity,unit,food_category";
-      const csvRows = pantryItems.map((item) => {
-        const categoryMap = {
-          protein: "Proteins",
-          dairy: "Dairy",
-          grain: "Grains",
-          fruit: "Fruits",
-          vegetable: "Vegetables",
-          other: "Other",
-        };
-        const category = categoryMap[item.category] || "Other";
-        return `${item.name},${item.quantity},${item.unit || "null"},${category}`;
-      });
-      const pantryCSV = [csvHeader, ...csvRows].join("\n");
+      const pantryCSV = pantryToSuggestionCSV(pantryItems);
 
       // Call the backend API
       const result = await recipeApi.getSuggestions(pantryCSV);
@@ -316,7 +303,9 @@ export function Suggestions() {
         setNotification({
           open: true,
           title: "Suggestions Generated!",
-          message: `Found ${transformedRecipes.length} recipe suggestions based on your pantry.`,
+          message: result.precomputed
+            ? `Found ${transformedRecipes.length} recipe suggestions, prepared ${Math.round(result.age_seconds / 60)} min ago from your current pantry.`
+            : `Found ${transformedRecipes.length} recipe suggestions based on your pantry.`,
         });
       } else {
         setNotification({
@@ -330,8 +319,9 @@ export function Suggestions() {
       setNotification({
         open: true,
         title: "Generation Failed",
-        message:
-          "Failed to generate suggestions. Make sure the backend server is running.",
+        message: err.status
+          ? err.message
+          : "Failed to generate suggestions. Make sure the backend server is running.",
       });
     } finally {
       setIsGenerating(false);
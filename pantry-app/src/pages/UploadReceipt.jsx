@@ -31,6 +31,9 @@ export function UploadReceipt() {
   const [extractedItems, setExtractedItems] = useState([]);
   const [selectedItems, setSelectedItems] = useState(new Set());
   const [isAdding, setIsAdding] = useState(false);
+  // Set when the backend matched this photo to an earlier scan instead of running OCR
+  const [duplicate, setDuplicate] = useState(null);
+  const [lastFile, setLastFile] = useState(null);
   const [notification, setNotification] = useState({
     show: false,
     message: "",
@@ -56,28 +59,39 @@ export function UploadReceipt() {
     }
   };
 
-  // Process uploaded image
-  const processImage = async (file) => {
+  // Process uploaded image (force skips the duplicate-receipt check)
+  const processImage = async (file, force = false) => {
     // Create preview
     const reader = new FileReader();
     reader.onload = (e) => {
       setUploadedImage(e.target.result);
     };
     reader.readAsDataURL(file);
+    setLastFile(file);
 
     // Process receipt through Flask API
     setIsProcessing(true);
+    setDuplicate(null);
     setNotification({ show: false, message: "", type: "success" });
 
     try {
       const formData = new FormData();
       formData.append("receipt", file);
+      if (force) {
+        formData.append("force", "1");
+      }
 
       const result = await pantryApi.uploadReceipt(formData);
 
       if (result.success && result.items) {
         setExtractedItems(result.items);
-        setSelectedItems(new Set(result.items.map((item) => item.id)));
+        if (result.duplicate) {
+          // Probably already in the pantry: make the user opt in rather than re-adding everything
+          setDuplicate({ hashDistance: result.hash_distance });
+          setSelectedItems(new Set());
+        } else {
+          setSelectedItems(new Set(result.items.map((item) => item.id)));
+        }
       } else {
         setNotification({
           show: true,
@@ -90,8 +104,9 @@ export function UploadReceipt() {
       console.error("Receipt processing error:", err);
       setNotification({
         show: true,
-        message:
-          "Failed to process receipt. Make sure the backend server is running on port 5001.",
+        message: err.status
+          ? err.message
+          : "Failed to process receipt. Make sure the backend server is running on port 5001.",
         type: "error",
       });
       setExtractedItems([]);
@@ -146,6 +161,7 @@ export function UploadReceipt() {
           expiryDate: null,
         });
       }
+      pantryFirebase.reportChange(user.uid);
 
       setNotification({
         show: true,
@@ -157,6 +173,7 @@ export function UploadReceipt() {
       setUploadedImage(null);
       setExtractedItems([]);
       setSelectedItems(new Set());
+      setDuplicate(null);
     } catch (error) {
       setNotification({
         show: true,
@@ -173,6 +190,8 @@ export function UploadReceipt() {
     setUploadedImage(null);
     setExtractedItems([]);
     setSelectedItems(new Set());
+    setDuplicate(null);
+    setLastFile(null);
   };
 
   return (
@@ -327,6 +346,24 @@ export function UploadReceipt() {
           <CardContent>
             {extractedItems.length > 0 ? (
               <div className="space-y-4">
+                {duplicate && (
+                  <div className="rounded-md border border-amber-200 bg-amber-50 p-3 space-y-2">
+                    <p className="text-sm text-amber-800">
+                      This looks like a receipt you already scanned, so these
+                      are the items from that scan and none are selected. If
+                      it's a different receipt, scan it again.
+                    </p>
+                    <Button
+                      variant="outline"
+                      size="sm"
+                      disabled={isProcessing || !lastFile}
+                      onClick={() => processImage(lastFile, true)}
+                    >
+                      <RotateCcw className="mr-2 h-4 w-4" />
+                      Rescan as new receipt
+                    </Button>
+                  </div>
+                )}
                 {/* Select All / None / Clear */}
                 <div className="flex gap-2 flex-wrap">
                   <Button
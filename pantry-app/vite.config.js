@@ -16,6 +16,8 @@ export default defineConfig({
       '/api': {
         target: 'http://localhost:5001',
         changeOrigin: true,
+        // Pass the real client address on so per-user limits don't all key on 127.0.0.1
+        xfwd: true,
       },
     },
   },